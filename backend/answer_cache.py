@@ -0,0 +1,127 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Function to normalize a question for the exact-match tier: case, spacing and
+# trailing punctuation do not change the answer
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.!").strip().lower()
+
+
+# Two-tier cache of /query answers for one vector store version.
+#
+# The exact tier is keyed by the normalized question. The semantic tier reuses
+# an answer when the cosine similarity between the new question's embedding and
+# a cached question's embedding reaches similarity_threshold. Both tiers share
+# one LRU order and TTL, and everything is dropped when the index version changes.
+class AnswerCache:
+    def __init__(self, ttl_seconds, max_entries, similarity_threshold):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # normalized question -> (expires_at, unit vector or None, value)
+        self._matrix = None            # stacked unit vectors of the semantic tier, rebuilt lazily
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+
+    @property
+    def semantic_enabled(self):
+        return self.similarity_threshold <= 1.0
+
+    # Function to drop every entry when the index changes
+    def invalidate(self, version):
+        with self._lock:
+            self._reset(version)
+
+    def _reset(self, version):
+        self.version = version
+        self._entries.clear()
+        self._matrix = None
+        self._matrix_keys = []
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._reset(version)
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < now:
+            del self._entries[key]
+            self._matrix = None
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_exact(self, question, version):
+        with self._lock:
+            self._check_version(version)
+            entry = self._live(normalize_question(question), time.time())
+            if entry is None:
+                return None
+            self.exact_hits += 1
+            return entry[2]
+
+    def get_semantic(self, vector, version):
+        if not self.semantic_enabled:
+            return None
+        query = _unit(vector)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            if self._matrix is None:
+                self._matrix_keys = [key for key, entry in self._entries.items() if entry[1] is not None]
+                self._matrix = np.stack([self._entries[key][1] for key in self._matrix_keys]) if self._matrix_keys else None
+            if self._matrix is None:
+                return None
+            similarities = self._matrix @ query
+            for position in np.argsort(-similarities):
+                if similarities[position] < self.similarity_threshold:
+                    break
+                entry = self._live(self._matrix_keys[position], now)
+                if entry is not None:
+                    self.semantic_hits += 1
+                    return entry[2]
+            return None
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, question, vector, version, value):
+        unit = _unit(vector) if vector is not None and self.semantic_enabled else None
+        with self._lock:
+            self._check_version(version)
+            key = normalize_question(question)
+            self._entries[key] = (time.time() + self.ttl_seconds, unit, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "version": self.version,
+            }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -1,30 +1,87 @@
 # main.py
 from fastapi import FastAPI, HTTPException, File, UploadFile
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import os
+import json
+import asyncio
 from langchain_groq import ChatGroq
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.documents import Document
 from dotenv import load_dotenv
-import pickle
 import time
 from fastapi.middleware.cors import CORSMiddleware
-import PyPDF2  # Ensure you have this installed
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
 import shutil
+from ingest import (
+    batched,
+    empty_manifest,
+    live_paths,
+    parse_pdfs,
+    plan_changes,
+    save_manifest,
+    scan_directory,
+    shutdown_parse_pool,
+    split_pages,
+    updated_manifest,
+)
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from pdf_text import PageTextCache, extract_text, resolve_backend
+from index_store import load_lexical_index, manifest_path, materialize, save_index
+from index_factory import IndexConfig, VectorStoreBuilder, apply_search_params, delete_vectors
+from chains import QA_PROMPT_TEMPLATE, ChainRegistry
+from lexical_index import LexicalIndex
+from retrieval import HybridRetriever
+from reranker import CrossEncoderReranker
+from timings import StageTimings
+from context_packer import ContextPacker, estimate_tokens
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import metrics
+from embedding_model import EmbeddingModelManager
+from embedding_executor import BatchedEmbeddingExecutor, set_intra_op_threads
+from jobs import JobManager
+from answer_cache import AnswerCache, normalize_question
+from coalesce import RequestCoalescer
+from uploads import RequestSizeLimit, UploadTooLarge, is_archive, save_archive, save_upload
+from collection_manager import DEFAULT_COLLECTION, Collection, CollectionManager, migrate_single_store
 
 load_dotenv()
 
-# Define the temporary directory path
+# Define the temporary directory path; every collection uploads into its own subdirectory
 TEMP_DIR = "./data"
 
+# Number of processes used to parse PDFs during /embed (1 parses serially)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+# Chunks pulled from the ingest pipeline per step; job progress is updated after
+# every step. The embedding executor sorts each step's chunks by length before
+# splitting them into model batches, so larger steps waste less on padding.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "1024"))
+# Model batches hold at most EMBED_MAX_BATCH_TOKENS padded tokens (the memory
+# target) and EMBED_MAX_BATCH_SIZE chunks. EMBED_WORKERS batches run at once,
+# each using EMBED_THREADS intra-op threads (0 keeps the library default).
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "16384"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "256"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+# Largest accepted upload, enforced while streaming (0 disables the limit)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+# Largest accepted zip/tar archive in /upload/batch
+MAX_ARCHIVE_BYTES = int(os.getenv("MAX_ARCHIVE_BYTES", str(4 * 1024 * 1024 * 1024)))
+
 app = FastAPI()
 
+# Reject oversized uploads before their body is received: a single PDF may be
+# MAX_UPLOAD_BYTES, a batch request (PDFs or archives) MAX_ARCHIVE_BYTES in total
+app.add_middleware(RequestSizeLimit, limits={
+    "/upload": MAX_UPLOAD_BYTES,
+    "/upload/batch": MAX_ARCHIVE_BYTES,
+})
+
+# Background executor for /embed jobs
+job_manager = JobManager()
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -38,14 +95,170 @@ app.add_middleware(
 groq_api_key = os.environ['GROQ_API_KEY']
 llm = ChatGroq(groq_api_key=groq_api_key, model_name="Llama3-8b-8192")
 
-# Initialize embeddings
-embedding = HuggingFaceEmbeddings()
-vector_store = None  # Initialize vector store
+# At most MAX_INFLIGHT_LLM_REQUESTS Groq calls run at once; identical questions
+# asked while one is in flight share its result
+MAX_INFLIGHT_LLM_REQUESTS = int(os.getenv("MAX_INFLIGHT_LLM_REQUESTS", "8"))
+llm_semaphore = asyncio.Semaphore(MAX_INFLIGHT_LLM_REQUESTS)
+query_coalescer = RequestCoalescer()
+
+# One embedding model, loaded once and shared by indexing and retrieval
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# torch, onnx or onnx_int8. ONNX exports are written once under ONNX_EXPORT_DIR;
+# ONNX_QUANTIZATION picks the int8 kernels (arm64, avx2, avx512, avx512_vnni).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_EXPORT_DIR = os.getenv("ONNX_EXPORT_DIR", "onnx_models")
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")
+embedding_model = EmbeddingModelManager(
+    EMBEDDING_MODEL_NAME, EMBED_MAX_BATCH_SIZE, EMBEDDING_BACKEND, ONNX_EXPORT_DIR, ONNX_QUANTIZATION, EMBED_THREADS
+)
+set_intra_op_threads(EMBED_THREADS)
+embedding_executor = BatchedEmbeddingExecutor(embedding_model, EMBED_MAX_BATCH_TOKENS, EMBED_MAX_BATCH_SIZE, EMBED_WORKERS)
+
+# Restricts retrieval to matching chunks. Fields are combined with AND; within
+# a list any value matches. Pages are 0-based, as in the chunk metadata.
+class QueryFilters(BaseModel):
+    filenames: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
 
 class Question(BaseModel):
     question: str
+    filters: Optional[QueryFilters] = None
+
+# Function to parse the comma-separated tags of an upload
+def parse_tags(tags):
+    return [tag.strip().lower() for tag in (tags or "").split(",") if tag.strip()]
+
+# Function to turn request filters into MetadataIndex.select arguments (None when nothing is filtered)
+def filter_arguments(filters):
+    if filters is None:
+        return None
+    arguments = {
+        "filenames": filters.filenames,
+        "tags": [tag.strip().lower() for tag in filters.tags] if filters.tags else None,
+        "page_from": filters.page_from,
+        "page_to": filters.page_to,
+        "uploaded_after": filters.uploaded_after.timestamp() if filters.uploaded_after else None,
+        "uploaded_before": filters.uploaded_before.timestamp() if filters.uploaded_before else None,
+    }
+    arguments = {name: value for name, value in arguments.items() if value is not None}
+    return arguments or None
+
+# Directory holding the memory-mapped vector store versions, one subdirectory per collection
+VECTOR_STORE_PATH = "vector_store"
+# FAISS index type (flat, ivf_flat, ivf_pq, hnsw) and its build/search parameters
+index_config = IndexConfig.from_env()
+# Fuse dense and BM25 results with reciprocal rank fusion (false uses dense search only)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+# Chunks passed to the LLM, and candidates fetched from each retriever before fusion
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "20"))
+
+# Optional cross-encoder re-ranking: retrieve RERANK_CANDIDATES chunks, score them
+# against the question in one CPU batch and pass the best RETRIEVAL_K to the LLM.
+# Re-ranking is cut down or skipped when it would take longer than RERANK_BUDGET_MS.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "200"))
+reranker = CrossEncoderReranker(RERANK_MODEL, RETRIEVAL_K, RERANK_BUDGET_MS) if RERANK_ENABLED else None
+
+# Latency of each query stage, reported by /query/timings
+stage_timings = StageTimings()
+
+# Retrieved chunks are de-duplicated, overlapping chunks of a page merged, and the
+# result packed in relevance order into CONTEXT_TOKEN_BUDGET estimated tokens
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+context_packer = ContextPacker(CONTEXT_TOKEN_BUDGET) if CONTEXT_PACKING else None
+
+# Function to record the latency of a query stage for /query/timings and /metrics
+def record_stage(stage, milliseconds):
+    stage_timings.record(stage, milliseconds)
+    metrics.QUERY_STAGE_SECONDS.labels(stage).observe(milliseconds / 1000)
+
+# Function to record the estimated prompt and completion tokens of one LLM call
+def record_llm_tokens(question, context, answer):
+    prompt = QA_PROMPT_TEMPLATE + question + "".join(doc.page_content for doc in context)
+    metrics.LLM_TOKENS.labels("prompt").observe(estimate_tokens(prompt))
+    metrics.LLM_TOKENS.labels("completion").observe(estimate_tokens(answer))
+
+# Function to record the size and rate of an upload request
+def record_upload(results, seconds):
+    stored = sum(result["size"] for result in results if not result["duplicate"])
+    metrics.UPLOAD_BYTES.inc(stored)
+    if seconds > 0:
+        metrics.UPLOAD_BYTES_PER_SECOND.observe(sum(result["size"] for result in results) / seconds)
+
+# Answer cache for repeated and near-duplicate questions, invalidated on every new index
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# Cosine similarity needed to reuse the answer of another question (above 1 disables the semantic tier)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Persistent cache of chunk embeddings, capped at EMBEDDING_CACHE_MAX_ENTRIES vectors
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+
+# PDF text extraction backend (auto, pypdfium2, pypdf, pdfminer); auto picks the fastest installed
+PDF_TEXT_BACKEND = resolve_backend(os.getenv("PDF_TEXT_BACKEND", "auto"))
+# Persistent cache of extracted page text, so re-embedding a file never parses it again
+PAGE_TEXT_CACHE_PATH = os.getenv("PAGE_TEXT_CACHE_PATH", "page_text_cache.sqlite3")
+PAGE_TEXT_CACHE_MAX_PAGES = int(os.getenv("PAGE_TEXT_CACHE_MAX_PAGES", "200000"))
+page_text_cache = PageTextCache(PAGE_TEXT_CACHE_PATH, PAGE_TEXT_CACHE_MAX_PAGES)
+
+# Function to build the retriever for a loaded vector store version
+def make_retriever(vector_store, lexical_index, metadata_index):
+    apply_search_params(vector_store.index, index_config)
+    # With re-ranking, the retriever over-fetches and the cross-encoder keeps RETRIEVAL_K
+    k = RERANK_CANDIDATES if reranker is not None else RETRIEVAL_K
+    return HybridRetriever(
+        vector_store=vector_store,
+        lexical_index=lexical_index if HYBRID_SEARCH else None,
+        metadata_index=metadata_index,
+        k=k,
+        fetch_k=max(k, RETRIEVAL_FETCH_K),
+    )
+
+# Function to create a collection with its own upload area, index directory,
+# chains (prompt, retriever and retrieval chain are built once per version) and answer cache
+def create_collection(name):
+    return Collection(
+        name,
+        upload_dir=os.path.join(TEMP_DIR, name),
+        store_path=os.path.join(VECTOR_STORE_PATH, name),
+        chain_registry=ChainRegistry(llm),
+        answer_cache=AnswerCache(ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY),
+        embedding_model=embedding_model,
+        make_retriever=make_retriever,
+    )
+
+# Named collections are loaded on first use. At most MAX_LOADED_COLLECTIONS stay
+# open; the least recently used are unloaded beyond that or while the process
+# uses more than COLLECTION_MEMORY_LIMIT_MB (0 disables the memory check).
+MAX_LOADED_COLLECTIONS = int(os.getenv("MAX_LOADED_COLLECTIONS", "8"))
+COLLECTION_MEMORY_LIMIT_MB = int(os.getenv("COLLECTION_MEMORY_LIMIT_MB", "0"))
+collection_manager = CollectionManager(
+    TEMP_DIR,
+    VECTOR_STORE_PATH,
+    create_collection,
+    max_loaded=MAX_LOADED_COLLECTIONS,
+    memory_limit_bytes=COLLECTION_MEMORY_LIMIT_MB * 1024 * 1024,
+)
+
+# Cache hit counts are read from the caches when /metrics is scraped
+metrics.register_cache_metrics(embedding_cache, page_text_cache, collection_manager)
 
-VECTOR_STORE_PATH = "vector_store.pkl"
+# Function to get a collection for a request, or fail it on an invalid name
+def get_collection(name, load=True):
+    try:
+        return collection_manager.get(name, load=load)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # Function to create the temporary directory
 def create_temp_directory():
@@ -57,14 +270,20 @@ def clear_temp_directory():
     if os.path.exists(TEMP_DIR):
         shutil.rmtree(TEMP_DIR)  # Remove the directory and its contents
         os.makedirs(TEMP_DIR)     # Recreate the directory
+    collection_manager.clear_uploads()
 
 @app.on_event("startup")
 async def startup_event():
+    embedding_model.warm()  # Load the embedding model before the first request
+    if reranker is not None:
+        reranker.warm()
     create_temp_directory()  # Create the temp directory on startup
     clear_temp_directory()    # Clear any existing files
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    job_manager.shutdown()
+    shutdown_parse_pool()
     clear_temp_directory()  # Clear the temp directory on shutdown
 
 @app.get("/")
@@ -72,125 +291,458 @@ async def root():
     return {
         "message": "Welcome to the PDF Query API",
         "endpoints": {
-            "/embed": "POST - Embed documents from uploaded PDF",
-            "/query": "POST - Query the embedded documents"
+            "/collections": "GET - Known collections and whether they are loaded",
+            "/upload/batch": "POST - Upload many PDFs or zip/tar archives of PDFs",
+            "/embed": "POST - Start a background job embedding the uploaded PDFs",
+            "/jobs/{job_id}": "GET - Progress of an embedding job",
+            "/embed/cache": "GET - Embedding cache hit and miss counts",
+            "/embed/stats": "GET - Embedding throughput and batch sizing",
+            "/query": "POST - Query the embedded documents",
+            "/query/stream": "POST - Query and stream the context and answer tokens as JSON lines",
+            "/query/cache": "GET - Answer cache hit and miss counts",
+            "/query/timings": "GET - Latency of each query stage and re-ranking counts",
+            "/metrics": "GET - Prometheus metrics for the ingest and query pipelines"
         }
     }
 
+@app.get("/collections")
+async def list_collections():
+    loaded = {collection.name: collection for collection in collection_manager.loaded()}
+    return {
+        "collections": [
+            loaded[name].describe() if name in loaded else {"name": name, "loaded": False}
+            for name in collection_manager.names()
+        ],
+        "max_loaded": collection_manager.max_loaded,
+        "evictions": collection_manager.evictions,
+    }
+
 @app.post("/upload")
-async def upload_pdf(pdf: UploadFile = File(...)):
+async def upload_pdf(pdf: UploadFile = File(...), collection: str = DEFAULT_COLLECTION, tags: str = ""):
     if pdf is None:
         return JSONResponse(content={"message": "No file uploaded."}, status_code=400)
+    target = get_collection(collection, load=False)
 
     try:
-        # Save the uploaded PDF to the temporary directory
-        file_location = os.path.join(TEMP_DIR, pdf.filename)
-        with open(file_location, "wb") as file:
-            file.write(await pdf.read())
-
-        return JSONResponse(content={"message": "PDF uploaded successfully."})
+        # Stream the uploaded PDF to the collection's upload directory in fixed-size chunks
+        start = time.perf_counter()
+        result = await save_upload(pdf, target.upload_index, MAX_UPLOAD_BYTES, parse_tags(tags))
+        record_upload([result], time.perf_counter() - start)
+
+        message = "PDF already uploaded." if result["duplicate"] else "PDF uploaded successfully."
+        return JSONResponse(content={"message": message, "collection": collection, **result})
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        metrics.ERRORS.labels("/upload").inc()
         print(f"Error occurred while uploading PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
     
-@app.post("/embed")
-async def embed_documents():
-    global vector_store
+@app.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...), embed: bool = False, collection: str = DEFAULT_COLLECTION, tags: str = ""):
+    if not files:
+        return JSONResponse(content={"message": "No file uploaded."}, status_code=400)
+    target = get_collection(collection, load=False)
+
     try:
-        # Initialize the embeddings and document loader
-        embedding = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        loader = DirectoryLoader(
-            TEMP_DIR,  # Use the 'data' directory for embedding
-            glob="**/*.pdf",
-            loader_cls=PyPDFLoader
-        )
-        
-        # Load documents from the temporary directory
-        docs = loader.load()
-        
-        if not docs:
-            raise HTTPException(status_code=400, detail="No documents found in the temporary directory. Please check the upload.")
-
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        final_documents = text_splitter.split_documents(docs)
-        
-        if not final_documents:
-            raise HTTPException(status_code=400, detail="No text could be extracted from the documents. Please check the content of the PDF files.")
-
-        # Create the vector store from the final documents
-        vector_store = FAISS.from_documents(final_documents, embedding)
-
-        # Save the vector store to a file
-        with open(VECTOR_STORE_PATH, 'wb') as f:
-            pickle.dump(vector_store, f)
-
-        return {
-            "message": "Embedding process completed successfully.",
-        }
+        # Stream every PDF, and every PDF inside zip/tar archives, to the temporary directory
+        results = []
+        upload_tags = parse_tags(tags)
+        claimed = set()  # Names stored by this request; a clash gets a hash suffix
+        start = time.perf_counter()
+        for upload in files:
+            if is_archive(upload.filename):
+                results.extend(await save_archive(upload, target.upload_index, MAX_ARCHIVE_BYTES, MAX_UPLOAD_BYTES, upload_tags, claimed))
+            else:
+                results.append(await save_upload(upload, target.upload_index, MAX_UPLOAD_BYTES, upload_tags, claimed))
+        record_upload(results, time.perf_counter() - start)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error occurred during embedding: {str(e)}")  # Log the error
+        metrics.ERRORS.labels("/upload/batch").inc()
+        print(f"Error occurred while uploading PDFs: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-# Load the vector store at startup
-def load_vector_store():
-    global vector_store
-    if os.path.exists(VECTOR_STORE_PATH):
-        with open(VECTOR_STORE_PATH, 'rb') as f:
-            vector_store = pickle.load(f)
-    else:
-        vector_store = None  # Initialize as None if the file does not exist
-
-@app.post("/query", description="Query the embedded documents with a question")
-async def query_documents(question: Question):
-    global vector_store
-    if vector_store is None:
-        raise HTTPException(status_code=400, detail="Vector store not created. Please call /embed url first.")
-    
-    if not question.question:
-        raise HTTPException(status_code=400, detail="Question is required.")
+    response = {
+        "message": f"{len(results)} PDF(s) uploaded successfully.",
+        "collection": collection,
+        "files": results,
+    }
+    if embed and results:
+        # Embed just these files; other files in the directory are left untouched
+        job = job_manager.submit(run_embedding, collection, only={result["filename"] for result in results})
+        response["job_id"] = job.id
+        response["status_url"] = f"/jobs/{job.id}"
+    return JSONResponse(content=response)
+
+# Function to build the file-level metadata used by query filters for one file
+def file_metadata(collection, corpus, relative_path):
+    return {
+        "filename": relative_path,
+        "uploaded_at": corpus[relative_path]["mtime"] / 1e9,
+        "tags": collection.upload_index.tags_for(relative_path),
+    }
 
-    try:
-        document_chain = create_stuff_documents_chain(llm, ChatPromptTemplate.from_template("""
-            Answer the question based on the provided context only.
-            Please provide the most accurate response based on the question.
+# Function to find indexed files whose file-level metadata changed while their
+# content did not, e.g. the same bytes uploaded again under another name or
+# with other tags. Only files in `scanned` (found on disk by this run) are
+# checked. Returns content hash -> the metadata its chunks should now carry.
+def changed_file_metadata(collection, vector_store, manifest, corpus, scanned):
+    changed = {}
+    for file_hash, relative_path in live_paths(corpus).items():
+        ids = manifest["documents"].get(file_hash)
+        if not ids or relative_path not in scanned:
+            continue
+        metadata = {"source": os.path.join(collection.upload_dir, relative_path), **file_metadata(collection, corpus, relative_path)}
+        stored = vector_store.docstore.search(ids[0])
+        if not isinstance(stored, Document) or any(stored.metadata.get(key) != value for key, value in metadata.items()):
+            changed[file_hash] = metadata
+    return changed
+
+# Function to split parsed files into chunks as they arrive, adding the
+# file-level metadata used by query filters. Yields (chunk id, text, metadata)
+# and records the chunk ids of every file in embedded_ids.
+def stream_chunks(job, collection, corpus, to_embed, parsed, text_splitter, embedded_ids):
+    for file_hash, (_, pages, parse_seconds) in zip(to_embed, parsed):
+        if pages and parse_seconds is not None:
+            metrics.PARSE_SECONDS_PER_PAGE.observe(parse_seconds / len(pages))
+            metrics.PAGES_PARSED.inc(len(pages))
+        split_start = time.perf_counter()
+        chunks, ids = split_pages(pages, file_hash, text_splitter)
+        metrics.SPLIT_SECONDS.observe(time.perf_counter() - split_start)
+        metadata = file_metadata(collection, corpus, to_embed[file_hash])
+        embedded_ids[file_hash] = ids
+        job.files_parsed += 1
+        # The total grows as files are split, so progress is an estimate until the last file
+        job.chunks_total += len(ids)
+        for chunk, chunk_id in zip(chunks, ids):
+            yield chunk_id, chunk.page_content, {**chunk.metadata, **metadata}
+
+# Function to compute the model's chunks/sec between two executor stats snapshots
+def embedding_throughput(before, after):
+    seconds = after["seconds"] - before["seconds"]
+    return round((after["chunks"] - before["chunks"]) / seconds, 1) if seconds > 0 else None
+
+# Function to build or update the vector store of one collection. Runs on the job
+# thread; queries keep using the previous index until the new one is published at
+# the end. When `only` names a set of files, just those files are embedded and nothing is removed.
+def run_embedding(job, name, full=False, only=None):
+    start_time = time.time()
+    collection = collection_manager.get(name)
+    vector_store, version, saved_manifest = collection.vector_store, collection.version, collection.manifest
+    embedding = embedding_model.model
+    cached_embedding = CachedEmbeddings(embedding_executor, embedding_model.cache_name, embedding_cache)
+    hits_before, misses_before = embedding_cache.hits, embedding_cache.misses
+    executor_before = embedding_executor.stats()
+
+    # Work out which files changed since the last embed. A full rebuild
+    # (or a missing vector store) starts from an empty manifest.
+    if full or vector_store is None:
+        manifest = empty_manifest()
+    else:
+        manifest = saved_manifest
+    scanned = scan_directory(collection.upload_dir, manifest, collection.upload_index.snapshot(), names=only)
+    corpus = scanned
+    if only is not None:
+        # Keep every file the index already knows about, so nothing is treated as deleted
+        corpus = {**manifest["files"], **scanned}
+
+    if not corpus:
+        raise HTTPException(status_code=400, detail="No documents found in the temporary directory. Please check the upload.")
+
+    to_embed, stale_ids = plan_changes(manifest, corpus)
+    # Unchanged content under a new name or with new tags keeps its vectors, but
+    # its chunks are re-labelled so results and filters show the current file
+    retag = changed_file_metadata(collection, vector_store, manifest, corpus, scanned) if manifest["documents"] else {}
+    job.files_total = len(to_embed)
+
+    # Stream the new or changed files through parse -> split -> embed -> index.
+    # Each stage pulls from the previous one, so memory holds a window of parsed
+    # files and one batch of chunks beyond the index itself.
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    files = [(os.path.join(collection.upload_dir, relative_path), file_hash) for file_hash, relative_path in to_embed.items()]
+    parsed = parse_pdfs(files, INGEST_WORKERS, PDF_TEXT_BACKEND, page_text_cache)
+    embedded_ids = {}
+    chunks = stream_chunks(job, collection, corpus, to_embed, parsed, text_splitter, embedded_ids)
+
+    mode = "full" if full or vector_store is None else "incremental"
+    if mode == "full":
+        builder = VectorStoreBuilder(embedding, index_config)
+        lexical = LexicalIndex.empty()
+    elif to_embed or stale_ids or retag:
+        # Copy the memory-mapped store into memory, remove vectors of deleted
+        # or changed files, then merge in the new ones as they are embedded
+        store = materialize(vector_store)
+        if stale_ids:
+            delete_vectors(store, stale_ids, index_config)
+        for file_hash, metadata in retag.items():
+            for chunk_id in manifest["documents"][file_hash]:
+                store.docstore.search(chunk_id).metadata.update(metadata)
+        builder = VectorStoreBuilder(embedding, index_config, store)
+        # A version saved without a BM25 index is indexed from the final store below
+        lexical = load_lexical_index(collection.store_path, version)
+        if lexical is not None:
+            lexical.delete(stale_ids)
+    else:
+        builder, lexical = None, None
+
+    # Embed the chunks in batches, sending only cache misses to the model
+    build_seconds, lexical_seconds = 0.0, 0.0
+    for batch in batched(chunks, EMBED_BATCH_SIZE):
+        ids, texts, metadatas = (list(column) for column in zip(*batch))
+        batch_start = time.perf_counter()
+        vectors = cached_embedding.embed_documents(texts)
+        batch_seconds = time.perf_counter() - batch_start
+        if batch_seconds > 0:
+            metrics.EMBED_CHUNKS_PER_SECOND.observe(len(vectors) / batch_seconds)
+        metrics.CHUNKS_EMBEDDED.inc(len(vectors))
+        job.chunks_embedded += len(vectors)
+
+        add_start = time.perf_counter()
+        builder.add(texts, vectors, metadatas, ids)
+        build_seconds += time.perf_counter() - add_start
+        if lexical is not None:
+            lexical_start = time.perf_counter()
+            lexical.add(ids, texts)
+            lexical_seconds += time.perf_counter() - lexical_start
+
+    new_manifest = updated_manifest(manifest, corpus, embedded_ids)
+    build_start = time.perf_counter()
+    store = builder.finish() if builder is not None else None
+    if mode == "full" and store is None:
+        raise HTTPException(status_code=400, detail="No text could be extracted from the documents. Please check the content of the PDF files.")
+
+    if store is not None:
+        metrics.INDEX_BUILD_SECONDS.labels("vector", mode).observe(build_seconds + time.perf_counter() - build_start)
+
+        # The BM25 index was updated batch by batch; a version saved without
+        # one is indexed from every chunk in the store
+        if lexical is None:
+            lexical_start = time.perf_counter()
+            lexical = LexicalIndex.empty()
+            all_ids = list(store.index_to_docstore_id.values())
+            lexical.add(all_ids, (store.docstore.search(doc_id).page_content for doc_id in all_ids))
+            lexical_seconds = time.perf_counter() - lexical_start
+        metrics.INDEX_BUILD_SECONDS.labels("bm25", mode).observe(lexical_seconds)
+
+        # Save the store as a new version, then swap in the memory-mapped copy
+        save_start = time.perf_counter()
+        save_index(store, collection.store_path, new_manifest, embedding_model.describe(), lexical)
+        metrics.INDEX_SAVE_SECONDS.observe(time.perf_counter() - save_start)
+        load_start = time.perf_counter()
+        collection.load()
+        metrics.INDEX_LOAD_SECONDS.observe(time.perf_counter() - load_start)
+    else:
+        # Nothing to re-index, but file sizes and mtimes may have changed
+        save_manifest(new_manifest, manifest_path(collection.store_path, version))
+        collection.manifest = new_manifest
 
-            Context:
-            {context}
+    return {
+        "message": "Embedding process completed successfully.",
+        "collection": name,
+        "files_embedded": len(to_embed),
+        "chunks_added": sum(len(ids) for ids in embedded_ids.values()),
+        "chunks_removed": len(stale_ids),
+        "files_relabelled": len(retag),
+        "cache_hits": embedding_cache.hits - hits_before,
+        "cache_misses": embedding_cache.misses - misses_before,
+        "chunks_per_second": embedding_throughput(executor_before, embedding_executor.stats()),
+        "time_taken": round(time.time() - start_time, 3),
+    }
 
-            Question: {input}
+@app.post("/embed", status_code=202)
+async def embed_documents(full: bool = False, collection: str = DEFAULT_COLLECTION):
+    get_collection(collection, load=False)
+    job = job_manager.submit(run_embedding, collection, full=full)
+    return {
+        "message": "Embedding job started.",
+        "collection": collection,
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+    }
 
-            Answer:
-        """))
-        
-        retriever = vector_store.as_retriever()
-        retrieval_chain = create_retrieval_chain(retriever, document_chain)
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+@app.get("/embed/stats")
+async def embedding_stats():
+    return embedding_executor.stats()
+
+@app.get("/embed/cache")
+async def embedding_cache_stats():
+    return {**embedding_cache.stats(), "page_text": page_text_cache.stats()}
+
+# Function to get a collection and the chain for its live index, or fail the
+# request. Loading a collection reads index files, so this runs on a worker thread.
+def get_prepared_chain(name, question):
+    collection = get_collection(name)
+    prepared = collection.chain_registry.current()
+    if prepared is None and not collection.loaded:
+        # Unloaded by another request since it was fetched
+        collection.ensure_loaded()
+        prepared = collection.chain_registry.current()
+    if prepared is None and collection.error:
+        raise HTTPException(status_code=409, detail=collection.error)
+    if prepared is None:
+        raise HTTPException(status_code=400, detail="Vector store not created. Please call /embed url first.")
 
-        response = retrieval_chain.invoke({'input': question.question})
+    if not question.question:
+        raise HTTPException(status_code=400, detail="Question is required.")
+    if filter_arguments(question.filters) and collection.metadata_index is None:
+        raise HTTPException(status_code=400, detail="This index was built without metadata filters. Please call /embed?full=true to rebuild it.")
+    return collection, prepared
+
+# Function to look up a cached answer, first by normalized question and then by
+# embedding similarity. Returns (cached response or None, question embedding);
+# the embedding is reused when the fresh answer is stored.
+def lookup_answer(answer_cache, question, version):
+    cached = answer_cache.get_exact(question, version)
+    if cached is not None:
+        return cached, None
+    vector = None
+    if answer_cache.semantic_enabled:
+        vector = embedding_model.model.embed_query(question)
+        cached = answer_cache.get_semantic(vector, version)
+    if cached is None:
+        answer_cache.record_miss()
+    return cached, vector
+
+# Function to retrieve the context for a question, re-rank it with the
+# cross-encoder and pack it into the token budget, as enabled. Retrieval and
+# re-ranking run on worker threads. Returns (context, packing report or None).
+async def retrieve_context(prepared, question, filters=None):
+    start = time.perf_counter()
+    context = await prepared.retriever.ainvoke(question, filters=filters)
+    record_stage("retrieval", (time.perf_counter() - start) * 1000)
+    if reranker is not None:
+        start = time.perf_counter()
+        context = await asyncio.to_thread(reranker.rerank, question, context)
+        record_stage("rerank", (time.perf_counter() - start) * 1000)
+    packing = None
+    if context_packer is not None:
+        start = time.perf_counter()
+        context, packing = context_packer.pack(context)
+        record_stage("packing", (time.perf_counter() - start) * 1000)
+    return context, packing
+
+# Function to answer a question without blocking the event loop: retrieval runs
+# on a worker thread and the Groq call is awaited under the concurrency cap
+async def answer_question(prepared, question, filters=None):
+    start = time.perf_counter()
+    context, packing = await retrieve_context(prepared, question, filters)
+    llm_start = time.perf_counter()
+    async with llm_semaphore:
+        answer = await prepared.document_chain.ainvoke({"input": question, "context": context})
+    record_stage("llm", (time.perf_counter() - llm_start) * 1000)
+    record_stage("total", (time.perf_counter() - start) * 1000)
+    record_llm_tokens(question, context, answer or "")
+    return {"answer": answer or "No answer found.", "context": context, "packing": packing}
 
-        # Ensure the response contains the expected keys
-        answer = response.get('answer', 'No answer found.')
-        context = response.get('context', 'No context available.')
+@app.post("/query", description="Query the embedded documents with a question")
+async def query_documents(question: Question, collection: str = DEFAULT_COLLECTION):
+    target, prepared = await asyncio.to_thread(get_prepared_chain, collection, question)
+    filters = filter_arguments(question.filters)
 
-        return {"answer": answer, "context": context}
+    try:
+        # The answer cache is keyed by question only, so filtered questions bypass it
+        if filters is None:
+            cached, vector = await asyncio.to_thread(lookup_answer, target.answer_cache, question.question, prepared.version)
+            if cached is not None:
+                return cached
+
+        key = (collection, prepared.version, normalize_question(question.question), json.dumps(filters, sort_keys=True))
+        result = await query_coalescer.run(key, lambda: answer_question(prepared, question.question, filters))
+        if filters is None:
+            target.answer_cache.put(question.question, vector, prepared.version, result)
+        return result
     except Exception as e:
+        metrics.ERRORS.labels("/query").inc()
         print(f"Error occurred during query processing: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+@app.post("/query/stream", description="Query the embedded documents and stream the answer as JSON lines")
+async def query_documents_stream(question: Question, collection: str = DEFAULT_COLLECTION):
+    target, prepared = await asyncio.to_thread(get_prepared_chain, collection, question)
+    filters = filter_arguments(question.filters)
+
+    # One JSON object per line: the retrieved context first, then answer tokens
+    # as the LLM produces them, then a final "done" (or "error") line
+    async def events():
+        try:
+            cached, vector = None, None
+            if filters is None:
+                cached, vector = await asyncio.to_thread(lookup_answer, target.answer_cache, question.question, prepared.version)
+            if cached is not None:
+                # A cached answer is sent as a single token
+                yield json.dumps({"type": "context", "context": jsonable_encoder(cached["context"]), "packing": cached.get("packing")}) + "\n"
+                yield json.dumps({"type": "token", "token": cached["answer"]}) + "\n"
+                yield json.dumps({"type": "done"}) + "\n"
+                return
+
+            start = time.perf_counter()
+            context, packing = await retrieve_context(prepared, question.question, filters)
+            yield json.dumps({"type": "context", "context": jsonable_encoder(context), "packing": packing}) + "\n"
+
+            # Streams need their own tokens, so they are capped but not coalesced
+            tokens = []
+            llm_start = time.perf_counter()
+            async with llm_semaphore:
+                async for token in prepared.document_chain.astream({"input": question.question, "context": context}):
+                    tokens.append(token)
+                    yield json.dumps({"type": "token", "token": token}) + "\n"
+            record_stage("llm", (time.perf_counter() - llm_start) * 1000)
+            record_stage("total", (time.perf_counter() - start) * 1000)
+            record_llm_tokens(question.question, context, "".join(tokens))
+            yield json.dumps({"type": "done"}) + "\n"
+            if filters is None:
+                target.answer_cache.put(question.question, vector, prepared.version, {"answer": "".join(tokens), "context": context, "packing": packing})
+        except Exception as e:
+            metrics.ERRORS.labels("/query/stream").inc()
+            print(f"Error occurred during query processing: {str(e)}")
+            yield json.dumps({"type": "error", "detail": f"An error occurred: {str(e)}"}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.get("/query/cache")
+async def answer_cache_stats(collection: str = DEFAULT_COLLECTION):
+    target = get_collection(collection, load=False)
+    return {
+        **target.answer_cache.stats(),
+        "coalesced_requests": query_coalescer.coalesced,
+        "inflight_requests": query_coalescer.inflight(),
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/query/timings")
+async def query_timings():
+    return {
+        "stages": stage_timings.stats(),
+        "rerank": reranker.stats() if reranker is not None else None,
+        "packing": context_packer.stats() if context_packer is not None else None,
+    }
+
+# Function to extract the text of a whole PDF (a path or binary file object)
 def extract_text_from_pdf(contents):
-    # Use PyPDF2 to extract text from th PDF
-    reader = PyPDF2.PdfReader(contents)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
+    return extract_text(contents, PDF_TEXT_BACKEND)
 
 
 
                 
 if __name__ == "__main__":
     print("Starting the server and deleting uploaded PDFs...")
-    load_vector_store()  # Load the vector store when the app starts
+    migrate_single_store(VECTOR_STORE_PATH)
+    collection_manager.get(DEFAULT_COLLECTION)  # Load the default collection when the app starts
     print("App is starting")
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
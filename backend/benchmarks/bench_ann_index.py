@@ -0,0 +1,115 @@
+# Recall-vs-latency benchmark of the ANN index types against the flat baseline.
+#
+# Builds every index type from index_factory on the same synthetic, clustered
+# vectors (shaped like sentence embeddings), sweeps nprobe / efSearch, and
+# reports build time, single-query latency percentiles and recall@k against
+# exact search. Use the numbers to pick INDEX_TYPE, IVF_NPROBE and HNSW_EF_SEARCH.
+#
+#   python benchmarks/bench_ann_index.py --vectors 200000 --queries 500
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_factory import IndexConfig, apply_search_params, build_index
+
+
+def synthetic_vectors(count, dimension, clusters, rng):
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.3 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found, truth))
+    return hits / truth.size
+
+
+# Function to search one query at a time, the way /query does
+def measure(index, queries, k):
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, rows = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = rows[0]
+    return found, latencies
+
+
+def result_row(name, params, build_seconds, found, latencies, truth):
+    return {
+        "index": name,
+        "params": params,
+        "build_seconds": round(build_seconds, 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "recall": round(recall_at_k(found, truth), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    rng = np.random.default_rng(0)
+    vectors = synthetic_vectors(args.vectors, args.dimension, args.clusters, rng)
+    queries = synthetic_vectors(args.queries, args.dimension, args.clusters, rng)
+
+    results = []
+    start = time.perf_counter()
+    flat = build_index(args.dimension, IndexConfig("flat"), vectors)
+    flat.add(vectors)
+    flat_build = time.perf_counter() - start
+    truth, latencies = measure(flat, queries, args.k)
+    results.append(result_row("flat", {}, flat_build, truth, latencies, truth))
+
+    sweeps = [
+        ("ivf_flat", "nprobe", [1, 4, 16, 64]),
+        ("ivf_pq", "nprobe", [1, 4, 16, 64]),
+        ("hnsw", "ef_search", [16, 32, 64, 128]),
+    ]
+    for index_type, knob, values in sweeps:
+        config = IndexConfig(index_type, nlist=args.nlist)
+        start = time.perf_counter()
+        index = build_index(args.dimension, config, vectors)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        for value in values:
+            setattr(config, knob, value)
+            apply_search_params(index, config)
+            found, latencies = measure(index, queries, args.k)
+            results.append(result_row(index_type, {knob: value}, build_seconds, found, latencies, truth))
+
+    report = {
+        "vectors": args.vectors,
+        "queries": args.queries,
+        "dimension": args.dimension,
+        "k": args.k,
+        "threads": args.threads,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Micro-benchmark of the per-query overhead of building the LLM chain.
+#
+# Compares rebuilding the prompt, stuff-documents chain and retriever on every
+# query (the old /query behaviour) with reading the prebuilt retriever and
+# document chain from ChainRegistry. Both run the steps /query runs: an async
+# retrieval followed by the document chain on the retrieved context. Runs
+# offline with a fake LLM and fake embeddings, so the numbers isolate chain
+# construction and LangChain dispatch overhead.
+#
+#   python benchmarks/bench_chain_registry.py --queries 2000
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import FakeEmbeddings
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+from chains import QA_PROMPT_TEMPLATE, ChainRegistry
+
+
+def build_per_request(llm, vector_store):
+    document_chain = create_stuff_documents_chain(llm, ChatPromptTemplate.from_template(QA_PROMPT_TEMPLATE))
+    return vector_store.as_retriever(), document_chain
+
+
+# Function to answer one question the way /query does
+async def answer(retriever, document_chain, question):
+    context = await retriever.ainvoke(question)
+    return await document_chain.ainvoke({"input": question, "context": context})
+
+
+def time_per_call(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+async def time_per_query(get_chain, question, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        await answer(*get_chain(), question)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    llm = FakeListChatModel(responses=["stub answer"])
+    embedding = FakeEmbeddings(size=384)
+    texts = [f"chunk {i} of a synthetic research paper" for i in range(args.chunks)]
+    vector_store = FAISS.from_texts(texts, embedding)
+
+    registry = ChainRegistry(llm)
+    registry.publish(1, vector_store)
+
+    def prebuilt():
+        prepared = registry.current()
+        return prepared.retriever, prepared.document_chain
+
+    # Construction cost alone: what every /query used to pay before doing any work
+    build_us = time_per_call(lambda: build_per_request(llm, vector_store), args.queries)
+    lookup_us = time_per_call(prebuilt, args.queries)
+
+    # End-to-end with the fake LLM, so retrieval and chain dispatch are included
+    question = "what is the main contribution?"
+    rebuild_query_us = asyncio.run(time_per_query(lambda: build_per_request(llm, vector_store), question, args.queries))
+    prebuilt_query_us = asyncio.run(time_per_query(prebuilt, question, args.queries))
+
+    report = {
+        "queries": args.queries,
+        "chunks": args.chunks,
+        "chain_setup_us": {"per_request": round(build_us, 2), "prebuilt": round(lookup_us, 2)},
+        "query_us": {"per_request": round(rebuild_query_us, 2), "prebuilt": round(prebuilt_query_us, 2)},
+        "overhead_saved_us": round(rebuild_query_us - prebuilt_query_us, 2),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
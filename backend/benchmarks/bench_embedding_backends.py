@@ -0,0 +1,106 @@
+# Parity and speed of the ONNX embedding backends against the PyTorch model.
+#
+# Embeds synthetic chunks and questions with the torch reference and with each
+# backend in --backends, through the same BatchedEmbeddingExecutor. Reports
+# per-chunk cosine similarity to the reference vectors, the overlap of each
+# question's top-k chunks with the reference top-k (what retrieval sees), and
+# chunks/s relative to torch. Exits with status 1 when a backend's mean cosine
+# falls below --min-cosine, so it can gate a backend switch.
+#
+#   python benchmarks/bench_embedding_backends.py --chunks 2000 --backends onnx,onnx_int8
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_embedding_executor import synthetic_chunks
+from bench_end_to_end import make_vocabulary, make_questions
+from embedding_executor import BatchedEmbeddingExecutor
+from embedding_model import DEFAULT_QUANTIZATION, EmbeddingModelManager
+
+
+def normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def embed(manager, chunks, questions):
+    manager.warm()
+    executor = BatchedEmbeddingExecutor(manager)
+    executor.embed_documents(chunks[:64])
+    start = time.perf_counter()
+    vectors = executor.embed_documents(chunks)
+    chunks_per_second = len(chunks) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    query_vectors = [manager.model.embed_query(question) for question in questions]
+    query_ms = (time.perf_counter() - start) / len(questions) * 1000
+    return normalized(vectors), normalized(query_vectors), chunks_per_second, query_ms
+
+
+def top_k(query_vectors, vectors, k):
+    return np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--backends", default="onnx,onnx_int8")
+    parser.add_argument("--quantization", default=DEFAULT_QUANTIZATION)
+    parser.add_argument("--export-dir", default="onnx_models")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    chunks = synthetic_chunks(args.chunks, rng)
+    words, _ = make_vocabulary(5000, rng)
+    questions = make_questions(args.queries, words, rng)
+
+    reference, reference_queries, reference_rate, reference_query_ms = embed(EmbeddingModelManager(args.model), chunks, questions)
+    reference_top = top_k(reference_queries, reference, args.k)
+
+    results, passed = [], True
+    for backend in args.backends.split(","):
+        manager = EmbeddingModelManager(args.model, backend=backend, export_root=args.export_dir, quantization=args.quantization)
+        vectors, query_vectors, rate, query_ms = embed(manager, chunks, questions)
+        cosine = (vectors * reference).sum(axis=1)
+        found = top_k(query_vectors, vectors, args.k)
+        overlap = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, reference_top)])
+        results.append({
+            "backend": backend,
+            "mean_cosine": round(float(cosine.mean()), 5),
+            "min_cosine": round(float(cosine.min()), 5),
+            f"top{args.k}_overlap": round(float(overlap), 4),
+            "chunks_per_second": round(rate, 1),
+            "speedup": round(rate / reference_rate, 2),
+            "query_ms": round(query_ms, 2),
+        })
+        passed &= bool(cosine.mean() >= args.min_cosine)
+
+    report = {
+        "model": args.model,
+        "chunks": len(chunks),
+        "queries": len(questions),
+        "torch": {"chunks_per_second": round(reference_rate, 1), "query_ms": round(reference_query_ms, 2)},
+        "results": results,
+        "min_cosine": args.min_cosine,
+        "passed": passed,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
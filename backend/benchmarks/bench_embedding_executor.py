@@ -0,0 +1,94 @@
+# Embedding throughput of BatchedEmbeddingExecutor settings on this machine.
+#
+# Embeds synthetic chunks whose lengths follow the splitter's output (mostly
+# full 1000-character chunks plus a tail of short page ends) with the plain
+# model (fixed batches of 32 in input order) and with the executor for every
+# combination of --threads, --workers and --batch-tokens. Reports chunks/s and
+# the share of padded tokens, to pick EMBED_THREADS, EMBED_WORKERS and
+# EMBED_MAX_BATCH_TOKENS per node type. Keep workers x threads at or below the core count.
+#
+#   python benchmarks/bench_embedding_executor.py --chunks 4000 --threads 1,2,4 --workers 1,2,4
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_end_to_end import make_vocabulary
+from embedding_executor import BatchedEmbeddingExecutor, set_intra_op_threads
+from embedding_model import EmbeddingModelManager
+
+# Share of chunks that are the short last chunk of a page
+SHORT_CHUNK_SHARE = 0.3
+
+
+def synthetic_chunks(count, rng):
+    words, _ = make_vocabulary(5000, rng)
+    chunks = []
+    for _ in range(count):
+        target = rng.randint(50, 900) if rng.random() < SHORT_CHUNK_SHARE else rng.randint(900, 1000)
+        text = ""
+        while len(text) < target:
+            text += rng.choice(words) + " "
+        chunks.append(text[:target])
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2"))
+    parser.add_argument("--threads", default="0", help="Intra-op thread counts to try (0 is the library default)")
+    parser.add_argument("--workers", default="1,2")
+    parser.add_argument("--batch-tokens", default="8192,16384,32768")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks, random.Random(0))
+    manager = EmbeddingModelManager(args.model, args.max_batch_size)
+    manager.warm()
+
+    # The model's own batching: fixed batches of 32, as HuggingFaceEmbeddings does by default
+    baseline_manager = EmbeddingModelManager(args.model)
+    baseline_manager.warm()
+    start = time.perf_counter()
+    baseline_manager.model.embed_documents(chunks)
+    baseline = round(len(chunks) / (time.perf_counter() - start), 1)
+
+    results = []
+    for threads, workers, batch_tokens in itertools.product(
+        (int(value) for value in args.threads.split(",")),
+        [int(value) for value in args.workers.split(",")],
+        [int(value) for value in args.batch_tokens.split(",")],
+    ):
+        set_intra_op_threads(threads)
+        executor = BatchedEmbeddingExecutor(manager, batch_tokens, args.max_batch_size, workers)
+        executor.embed_documents(chunks[:64])  # warm up the thread pools
+        executor = BatchedEmbeddingExecutor(manager, batch_tokens, args.max_batch_size, workers)
+        executor.embed_documents(chunks)
+        stats = executor.stats()
+        results.append({
+            "threads": threads,
+            "workers": workers,
+            "max_batch_tokens": batch_tokens,
+            "chunks_per_second": stats["chunks_per_second"],
+            "speedup": round(stats["chunks_per_second"] / baseline, 2),
+            "batches": stats["batches"],
+            "padding_ratio": stats["padding_ratio"],
+            "oom_retries": stats["oom_retries"],
+        })
+
+    report = {"chunks": len(chunks), "model": args.model, "baseline_chunks_per_second": baseline, "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
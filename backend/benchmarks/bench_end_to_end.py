@@ -0,0 +1,352 @@
+# End-to-end benchmark of upload, embed and query through the FastAPI app.
+#
+# Generates a synthetic PDF corpus, then drives the real endpoints in-process
+# (httpx over ASGI, no network) in a temporary working directory:
+#   ingest   upload bytes/s, /embed pages/s and chunks/s, index build, save and
+#            load time, and the size of the saved index version on disk
+#   cold     time to open the saved collection in a fresh Collection, as after
+#            a restart (the OS page cache is warm, so this is a lower bound)
+#   query    p50/p99 latency and throughput of /query at each concurrency level;
+#            failed queries are reported as errors and make the run exit with status 1
+# Groq is replaced by a local stub chat model with a fixed latency, so the run
+# is offline; the embedding model must already be in the local cache. The
+# semantic answer cache is off unless ANSWER_CACHE_SIMILARITY is set, since the
+# templated questions are similar enough to answer each other.
+# --embedding-backend runs the whole pipeline on torch, onnx or onnx_int8; the
+# cold start fails if the saved index is refused by the backend that built it.
+#
+#   python benchmarks/bench_end_to_end.py --files 50 --pages-per-file 40 --concurrency 1,8,32
+#   python benchmarks/bench_end_to_end.py --embedding-backend onnx_int8
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from prometheus_client import REGISTRY
+
+from index_store import version_dir
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "su", "to", "vi", "xe", "zo", "ban", "cor", "del", "fin", "gor", "hal", "jun", "mer", "pol", "tek"]
+LINES_PER_PAGE = 60
+WORDS_PER_LINE = 11
+
+
+# Stand-in for ChatGroq: answers every prompt with the same text after a fixed delay
+class StubChatModel(BaseChatModel):
+    latency_ms: float = 300.0
+    answer: str = "This is a stub answer used for benchmarking."
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _result(self):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        return self._result()
+
+    async def _agenerate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._result()
+
+
+# Function to build a vocabulary of made-up words, sampled with Zipf-like
+# frequencies so the corpus has common and rare terms like real text
+def make_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    weights = [1.0 / rank for rank in range(1, size + 1)]
+    return words, weights
+
+
+# Function to write a minimal PDF with one Helvetica text stream per page
+def write_pdf(path, pages):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for lines in pages:
+        text = " T* ".join(f"({line}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 780 Td {text} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_refs.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % ref for ref in page_refs), len(page_refs))
+
+    parts, offsets, size = [b"%PDF-1.4\n"], [], 9
+    for number, body in enumerate(objects, start=1):
+        offsets.append(size)
+        part = b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        parts.append(part)
+        size += len(part)
+    xref = [b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)]
+    xref.extend(b"%010d 00000 n \n" % offset for offset in offsets)
+    trailer = b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, size)
+    with open(path, "wb") as f:
+        f.write(b"".join(parts + xref + [trailer]))
+
+
+# Function to generate the corpus; returns the PDF paths
+def generate_corpus(directory, files, pages_per_file, words, weights, rng):
+    os.makedirs(directory, exist_ok=True)
+    cumulative = list(_accumulate(weights))
+    paths = []
+    for number in range(files):
+        pages = []
+        for _ in range(pages_per_file):
+            sampled = rng.choices(words, cum_weights=cumulative, k=LINES_PER_PAGE * WORDS_PER_LINE)
+            pages.append([" ".join(sampled[i:i + WORDS_PER_LINE]) for i in range(0, len(sampled), WORDS_PER_LINE)])
+        path = os.path.join(directory, f"doc-{number:05d}.pdf")
+        write_pdf(path, pages)
+        paths.append(path)
+    return paths
+
+
+def _accumulate(values):
+    total = 0.0
+    for value in values:
+        total += value
+        yield total
+
+
+# Function to make distinct questions from mid-frequency words, so neither the
+# answer cache nor the request coalescer answers them
+def make_questions(count, words, rng):
+    pool = words[50:2000] or words
+    questions = set()
+    while len(questions) < count:
+        questions.add(f"What does the document say about {' '.join(rng.sample(pool, 3))}?")
+    return sorted(questions)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))], 2)
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def sample(name, **labels):
+    return round(REGISTRY.get_sample_value(name, labels) or 0.0, 4)
+
+
+async def wait_for_job(client, job_id):
+    while True:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        await asyncio.sleep(0.05)
+
+
+async def run_queries(client, collection, questions, concurrency):
+    queue = list(questions)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            question = queue.pop()
+            start = time.perf_counter()
+            response = await client.post("/query", params={"collection": collection}, json={"question": question})
+            # Failed requests are counted, not timed, so they cannot pass for fast answers
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "queries": len(latencies),
+        "errors": errors,
+        "throughput_qps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else None,
+        "p50_ms": percentile(latencies, 50) if latencies else None,
+        "p99_ms": percentile(latencies, 99) if latencies else None,
+    }
+
+
+async def benchmark(server, args, paths, questions):
+    collection = args.collection
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        server.embedding_model.warm()
+        model_load_seconds = time.perf_counter() - start
+
+        # Upload
+        handles = [open(path, "rb") for path in paths]
+        try:
+            start = time.perf_counter()
+            response = await client.post(
+                "/upload/batch",
+                params={"collection": collection},
+                files=[("files", (os.path.basename(f.name), f, "application/pdf")) for f in handles],
+            )
+            upload_seconds = time.perf_counter() - start
+        finally:
+            for f in handles:
+                f.close()
+        response.raise_for_status()
+        upload_bytes = sum(result["size"] for result in response.json()["files"])
+
+        # Embed
+        response = await client.post("/embed", params={"collection": collection, "full": "true"})
+        response.raise_for_status()
+        job = await wait_for_job(client, response.json()["job_id"])
+        if job["status"] != "completed":
+            raise RuntimeError(f"Embedding failed: {job['error']}")
+        embed_seconds = job["result"]["time_taken"]
+        # ru_maxrss is in kilobytes on Linux; the peak includes the embedding model
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        chunks = job["result"]["chunks_added"]
+        pages = args.files * args.pages_per_file
+
+        target = server.collection_manager.get(collection)
+        index_bytes = directory_size(version_dir(target.store_path, target.version))
+
+        # Cold start: open the saved index in a collection object with no state
+        load_times = []
+        for _ in range(args.load_repeats):
+            fresh = server.create_collection(collection)
+            start = time.perf_counter()
+            fresh.load()
+            load_times.append((time.perf_counter() - start) * 1000)
+            if fresh.error or fresh.vector_store is None:
+                raise RuntimeError(f"The saved index could not be loaded: {fresh.error}")
+            fresh.unload()
+
+        # Query load, one round per concurrency level with its own questions
+        response = await client.post("/query", params={"collection": collection}, json={"question": "warm up"})
+        response.raise_for_status()
+        levels = [int(level) for level in args.concurrency.split(",")]
+        query_results = []
+        for round_number, level in enumerate(levels):
+            batch = questions[round_number * args.queries:(round_number + 1) * args.queries]
+            query_results.append(await run_queries(client, collection, batch, level))
+        stages = (await client.get("/query/timings")).json()["stages"]
+
+    return {
+        "ingest": {
+            "files": args.files,
+            "pages": pages,
+            "chunks": chunks,
+            "upload_bytes": upload_bytes,
+            "upload_mb_per_second": round(upload_bytes / upload_seconds / 1e6, 2),
+            "embed_seconds": embed_seconds,
+            "pages_per_second": round(pages / embed_seconds, 2),
+            "chunks_per_second": round(chunks / embed_seconds, 2),
+            "vector_index_build_seconds": sample("pdfquery_index_build_seconds_sum", index="vector", mode="full"),
+            "bm25_index_build_seconds": sample("pdfquery_index_build_seconds_sum", index="bm25", mode="full"),
+            "index_save_seconds": sample("pdfquery_index_save_seconds_sum"),
+            "index_bytes": index_bytes,
+            "peak_rss_mb": round(peak_rss_mb, 1),
+        },
+        "cold_start": {
+            "model_load_seconds": round(model_load_seconds, 3),
+            "index_load_p50_ms": round(statistics.median(load_times), 2),
+            "index_load_max_ms": round(max(load_times), 2),
+        },
+        "query": query_results,
+        "query_stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--pages-per-file", type=int, default=20)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200, help="Queries per concurrency level")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--load-repeats", type=int, default=5)
+    parser.add_argument("--collection", default="bench")
+    parser.add_argument("--workdir", help="Directory for the corpus, uploads and index (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding-backend", default=os.getenv("EMBEDDING_BACKEND", "torch"),
+                        help="torch, onnx or onnx_int8")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="pdfquery-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    rng = random.Random(args.seed)
+    words, weights = make_vocabulary(args.vocabulary, rng)
+    start = time.perf_counter()
+    paths = generate_corpus(os.path.join(workdir, "corpus"), args.files, args.pages_per_file, words, weights, rng)
+    generate_seconds = time.perf_counter() - start
+    levels = args.concurrency.split(",")
+    questions = make_questions(args.queries * len(levels), words, rng)
+
+    # The app keeps its uploads, index and embedding cache relative to the
+    # working directory, and reads GROQ_API_KEY and EMBEDDING_BACKEND at import time
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+    os.environ["EMBEDDING_BACKEND"] = args.embedding_backend
+    os.environ.setdefault("ANSWER_CACHE_SIMILARITY", "2")
+    os.chdir(workdir)
+    import app as server
+    # Collections build their chains from this module-level LLM when first opened
+    server.llm = StubChatModel(latency_ms=args.llm_latency_ms)
+
+    try:
+        results = asyncio.run(benchmark(server, args, paths, questions))
+    finally:
+        server.job_manager.shutdown()
+        os.chdir(BACKEND_DIR)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "config": {
+            "files": args.files,
+            "pages_per_file": args.pages_per_file,
+            "words_per_page": LINES_PER_PAGE * WORDS_PER_LINE,
+            "corpus_generation_seconds": round(generate_seconds, 2),
+            "llm_latency_ms": args.llm_latency_ms,
+            "embedding_model": server.EMBEDDING_MODEL_NAME,
+            "embedding_backend": server.EMBEDDING_BACKEND,
+            "index_type": server.index_config.index_type,
+            "hybrid_search": server.HYBRID_SEARCH,
+            "rerank": server.RERANK_ENABLED,
+            "ingest_workers": server.INGEST_WORKERS,
+            "max_inflight_llm_requests": server.MAX_INFLIGHT_LLM_REQUESTS,
+        },
+        **results,
+    }
+    print(json.dumps(report, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    errors = sum(level["errors"] for level in results["query"])
+    if errors:
+        print(f"{errors} queries failed; their latencies are not included above", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Latency and recall of metadata-filtered search at different selectivities.
+#
+# Synthetic vectors are grouped into files of --chunks-per-file rows; a filter
+# selects a share of the files. For each index type and selectivity, compares
+# search_index_rows (exact scoring for small selections, a FAISS bitmap
+# selector otherwise) with the naive approach of over-fetching k / selectivity
+# results and filtering them afterwards. Recall is measured against exact
+# search over the selected rows; unfiltered latency is given for reference.
+#
+#   python benchmarks/bench_filtered_search.py --vectors 200000
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ann_index import recall_at_k, synthetic_vectors
+from index_factory import IndexConfig, build_index
+from retrieval import search_index_rows
+
+
+def percentile(latencies, q):
+    return round(float(np.percentile(latencies, q)), 4)
+
+
+def post_filter(index, query, k, mask, selectivity):
+    fetch = min(index.ntotal, int(np.ceil(k / selectivity)) * 2)
+    _, rows = index.search(query, fetch)
+    rows = rows[0][rows[0] >= 0]
+    return rows[mask[rows]][:k]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--chunks-per-file", type=int, default=50)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--selectivities", default="0.001,0.01,0.1,0.5")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    rng = np.random.default_rng(0)
+    vectors = synthetic_vectors(args.vectors, args.dimension, args.clusters, rng)
+    queries = synthetic_vectors(args.queries, args.dimension, args.clusters, rng)
+    files = np.arange(args.vectors) // args.chunks_per_file
+    file_count = int(files[-1]) + 1
+
+    results = []
+    for index_type in ("flat", "ivf_flat", "hnsw"):
+        index = build_index(args.dimension, IndexConfig(index_type, nlist=256), vectors)
+        index.add(vectors)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query[None, :], args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        row = {"index": index_type, "unfiltered_p50_ms": percentile(latencies, 50), "filters": []}
+
+        for selectivity in (float(value) for value in args.selectivities.split(",")):
+            chosen = rng.choice(file_count, max(1, int(file_count * selectivity)), replace=False)
+            mask = np.isin(files, chosen)
+            rows = np.flatnonzero(mask)
+            truth = []
+            for query in queries:
+                distances = ((vectors[rows] - query) ** 2).sum(axis=1)
+                truth.append(rows[np.argsort(distances)[:args.k]])
+
+            measured = {}
+            for name, search in (
+                ("selector", lambda q: search_index_rows(index, q, args.k, rows)),
+                ("post_filter", lambda q: post_filter(index, q, args.k, mask, selectivity)),
+            ):
+                latencies, found = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    result = search(query[None, :])
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found.append(np.pad(result, (0, args.k - len(result)), constant_values=-1))
+                measured[name] = {
+                    "p50_ms": percentile(latencies, 50),
+                    "p99_ms": percentile(latencies, 99),
+                    "recall": round(recall_at_k(np.array(found), np.array(truth)), 4),
+                }
+            row["filters"].append({"selectivity": selectivity, "rows": len(rows), **measured})
+        results.append(row)
+
+    report = {"vectors": args.vectors, "dimension": args.dimension, "k": args.k, "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
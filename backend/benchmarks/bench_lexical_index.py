@@ -0,0 +1,95 @@
+# Build time, update time and query latency of the BM25 inverted index.
+#
+# Generates chunks of Zipf-distributed words (so a few terms have very long
+# posting lists, as in real text), builds and saves the index, applies an
+# incremental update (delete 1% of the chunks, add 1% new ones), then reports
+# single-query latency percentiles on the memory-mapped index for queries of
+# one to four terms drawn from the same distribution.
+#
+#   python benchmarks/bench_lexical_index.py --chunks 1000000
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexical_index import LexicalIndex
+
+
+def synthetic_texts(count, words_per_chunk, vocabulary, rng):
+    words = rng.zipf(1.2, size=(count, words_per_chunk)) % vocabulary
+    return [" ".join(f"t{word}" for word in row) for row in words]
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--words-per-chunk", type=int, default=150)
+    parser.add_argument("--vocabulary", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = synthetic_texts(args.chunks, args.words_per_chunk, args.vocabulary, rng)
+    ids = [f"doc{i // 50}:{i % 50}" for i in range(args.chunks)]
+
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        index = LexicalIndex.empty()
+        index.add(ids, texts)
+        index.save(os.path.join(root, "v1"))
+        build_seconds = time.perf_counter() - start
+
+        changed = max(1, args.chunks // 100)
+        start = time.perf_counter()
+        index = LexicalIndex.load(os.path.join(root, "v1"))
+        index.delete(ids[:changed])
+        index.add([f"new{i}:0" for i in range(changed)], synthetic_texts(changed, args.words_per_chunk, args.vocabulary, rng))
+        index.save(os.path.join(root, "v2"))
+        update_seconds = time.perf_counter() - start
+
+        index = LexicalIndex.load(os.path.join(root, "v2"))
+        results = []
+        for terms in (1, 2, 4):
+            queries = synthetic_texts(args.queries, terms, args.vocabulary, rng)
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                index.search(query, args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+            results.append({
+                "query_terms": terms,
+                "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+            })
+
+        report = {
+            "chunks": args.chunks,
+            "words_per_chunk": args.words_per_chunk,
+            "terms": len(index.terms),
+            "postings": len(index.postings_docs),
+            "build_seconds": round(build_seconds, 3),
+            "update_seconds": round(update_seconds, 3),
+            "index_bytes": directory_bytes(os.path.join(root, "v2")),
+            "k": args.k,
+            "results": results,
+        }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
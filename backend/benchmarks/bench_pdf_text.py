@@ -0,0 +1,74 @@
+# Page text extraction speed of each installed PDF backend, and of the page text cache.
+#
+# Generates a synthetic corpus (see bench_end_to_end.py), extracts every file
+# with each backend in pdf_text.BACKENDS that is installed, then reads the same
+# files back from a PageTextCache, as a re-embed does.
+#
+#   python benchmarks/bench_pdf_text.py --files 10 --pages-per-file 200
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_end_to_end import generate_corpus, make_vocabulary
+from ingest import file_sha256
+from pdf_text import PageTextCache, available_backends, extract_pages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--pages-per-file", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pdfquery-text-")
+    try:
+        rng = random.Random(args.seed)
+        words, weights = make_vocabulary(20000, rng)
+        paths = generate_corpus(os.path.join(workdir, "corpus"), args.files, args.pages_per_file, words, weights, rng)
+        hashes = [file_sha256(path) for path in paths]
+        pages = args.files * args.pages_per_file
+
+        results = []
+        for backend in available_backends():
+            cache = PageTextCache(os.path.join(workdir, f"{backend}.sqlite3"), pages)
+            start = time.perf_counter()
+            characters = 0
+            for path, file_hash in zip(paths, hashes):
+                texts = extract_pages(path, backend)
+                characters += sum(len(text) for text in texts)
+                cache.put(file_hash, texts, backend)
+            extract_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            cached = cache.cached_files(hashes, backend)
+            for file_hash in hashes:
+                cache.get(file_hash)
+            cached_seconds = time.perf_counter() - start
+            results.append({
+                "backend": backend,
+                "pages_per_second": round(pages / extract_seconds, 1),
+                "characters": characters,
+                "cached_files": len(cached),
+                "cached_pages_per_second": round(pages / cached_seconds, 1),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"files": args.files, "pages": pages, "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Memory and recall of the compressed vector storage modes.
+#
+# For each VECTOR_STORAGE mode, builds a flat index over synthetic vectors and
+# reports the resident index size, recall@k of the compressed index alone, and
+# recall@k / latency after exact float32 re-ranking of the top
+# rerank_factor * k candidates, all against an uncompressed float32 index. The
+# float32 vectors used for re-ranking are memory-mapped from a temporary file,
+# as they are when the vector store is loaded.
+#
+#   python benchmarks/bench_quantization.py --vectors 200000
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ann_index import recall_at_k, synthetic_vectors
+from index_factory import IndexConfig, new_index
+from quantization import RerankedIndex, raw_index
+
+
+def search_all(index, queries, k):
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, rows = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = rows[0]
+    return found, latencies
+
+
+def index_bytes(index):
+    return int(faiss.serialize_index(raw_index(index)).nbytes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rerank-factors", default="1,2,4,8")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    rng = np.random.default_rng(0)
+    vectors = synthetic_vectors(args.vectors, args.dimension, args.clusters, rng)
+    queries = synthetic_vectors(args.queries, args.dimension, args.clusters, rng)
+
+    baseline = new_index(args.dimension, IndexConfig("flat"), vectors)
+    baseline.add(vectors)
+    truth, latencies = search_all(baseline, queries, args.k)
+    results = [{
+        "storage": "float32",
+        "index_bytes": index_bytes(baseline),
+        "compression": 1.0,
+        "recall_without_rerank": 1.0,
+        "reranked": [],
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+    }]
+
+    with tempfile.TemporaryDirectory() as directory:
+        vectors_path = os.path.join(directory, "vectors.npy")
+        np.save(vectors_path, vectors)
+        mapped_vectors = np.load(vectors_path, mmap_mode="r")
+
+        for storage in ("float16", "sq8", "pq"):
+            config = IndexConfig("flat", storage=storage)
+            index = raw_index(new_index(args.dimension, config, vectors))
+            index.add(vectors)
+            found, latencies = search_all(index, queries, args.k)
+            row = {
+                "storage": storage,
+                "index_bytes": index_bytes(index),
+                "compression": round(index_bytes(baseline) / index_bytes(index), 2),
+                "recall_without_rerank": round(recall_at_k(found, truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+                "reranked": [],
+            }
+            for factor in (int(value) for value in args.rerank_factors.split(",")):
+                reranked = RerankedIndex(index, mapped_vectors, factor)
+                found, latencies = search_all(reranked, queries, args.k)
+                row["reranked"].append({
+                    "rerank_factor": factor,
+                    "recall": round(recall_at_k(found, truth), 4),
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+                    "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+                })
+            results.append(row)
+
+    report = {
+        "vectors": args.vectors,
+        "dimension": args.dimension,
+        "k": args.k,
+        "float32_vectors_on_disk_bytes": int(vectors.nbytes),
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
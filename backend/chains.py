@@ -0,0 +1,54 @@
+import threading
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.prompts import ChatPromptTemplate
+
+QA_PROMPT_TEMPLATE = """
+    Answer the question based on the provided context only.
+    Please provide the most accurate response based on the question.
+
+    Context:
+    {context}
+
+    Question: {input}
+
+    Answer:
+"""
+
+
+# Retriever and document chain built once for one version of the vector store.
+# /query retrieves with `retriever` and answers with `document_chain`.
+# Without a retriever, plain dense similarity search is used.
+class PreparedChain:
+    def __init__(self, version, vector_store, document_chain, retriever=None):
+        self.version = version
+        self.vector_store = vector_store
+        self.document_chain = document_chain
+        self.retriever = retriever if retriever is not None else vector_store.as_retriever()
+
+
+# Holds the prebuilt chain for the live vector store. /embed publishes a new
+# PreparedChain after saving a new version; queries read the current one with a
+# single attribute access, so they always see a complete chain, old or new.
+class ChainRegistry:
+    def __init__(self, llm, prompt_template=QA_PROMPT_TEMPLATE):
+        # The prompt and stuff-documents chain do not depend on the index, so they are built once
+        self.prompt = ChatPromptTemplate.from_template(prompt_template)
+        self.document_chain = create_stuff_documents_chain(llm, self.prompt)
+        self._current = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        return self._current
+
+    def publish(self, version, vector_store, retriever=None):
+        prepared = PreparedChain(version, vector_store, self.document_chain, retriever) if vector_store is not None else None
+        with self._lock:
+            # Never replace a newer index with an older one
+            if prepared is None or self._current is None or version >= self._current.version:
+                self._current = prepared
+        return self._current
+
+    def clear(self):
+        with self._lock:
+            self._current = None
@@ -0,0 +1,23 @@
+import asyncio
+
+
+# Runs at most one coroutine per key at a time. Callers that ask for a key that
+# is already in flight await the same result instead of starting another call.
+class RequestCoalescer:
+    def __init__(self):
+        self._inflight = {}
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield the shared task so one disconnecting client does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def inflight(self):
+        return len(self._inflight)
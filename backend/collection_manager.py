@@ -0,0 +1,193 @@
+import os
+import re
+import shutil
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # Memory-pressure eviction is disabled without psutil
+    psutil = None
+
+from embedding_model import IncompatibleIndexError
+from index_store import load_index, load_lexical_index, load_metadata_index
+from uploads import UploadIndex
+
+DEFAULT_COLLECTION = "default"
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def validate_collection_name(name):
+    if not COLLECTION_NAME_PATTERN.match(name or ""):
+        raise ValueError(
+            f"Invalid collection name {name!r}. Use up to 64 letters, digits, '-' or '_', "
+            "starting with a letter or digit."
+        )
+    return name
+
+
+# One named corpus: its own upload directory, vector store versions, BM25 and
+# metadata filter indexes, chains and answer cache. The upload index always stays in memory; the vector
+# store and chains are loaded on first use and dropped again by unload().
+class Collection:
+    def __init__(self, name, upload_dir, store_path, chain_registry, answer_cache, embedding_model, make_retriever):
+        self.name = name
+        self.upload_dir = upload_dir
+        self.store_path = store_path
+        self.chain_registry = chain_registry
+        self.answer_cache = answer_cache
+        self.embedding_model = embedding_model
+        self.make_retriever = make_retriever
+        os.makedirs(upload_dir, exist_ok=True)
+        self.upload_index = UploadIndex(upload_dir)
+        self.vector_store = None
+        self.version = 0
+        self.manifest = None
+        self.error = None  # Why the saved index could not be served, if it was refused
+        self.lexical_index = None
+        self.metadata_index = None
+        self.loaded = False
+        self.last_used = time.monotonic()
+        self._lock = threading.RLock()
+
+    # Function to open the current saved version, if it is not open already
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self.load()
+
+    # Function to (re)load the current saved version and serve it. Called on first
+    # use and by /embed after saving a new version.
+    def load(self):
+        with self._lock:
+            try:
+                # vector_store is None if nothing has been saved yet
+                vector_store, version, manifest = load_index(self.store_path, self.embedding_model)
+            except IncompatibleIndexError as e:
+                # Never answer queries from an index built with another model
+                print(f"Refusing to load the saved vector store of collection {self.name!r}: {str(e)}")
+                self.error = str(e)
+                self.loaded = True
+                return
+            self.vector_store, self.version, self.manifest = vector_store, version, manifest
+            self.error = None
+            self.lexical_index = load_lexical_index(self.store_path, version)
+            self.metadata_index = load_metadata_index(self.store_path, version)
+            retriever = None
+            if vector_store is not None:
+                retriever = self.make_retriever(vector_store, self.lexical_index, self.metadata_index)
+            self.chain_registry.publish(version, vector_store, retriever)
+            self.answer_cache.invalidate(version)
+            self.loaded = True
+
+    # Function to drop the memory-mapped index and chains. Queries already running
+    # keep their own references; the next request loads the collection again.
+    # The manifest is small and stays, so a running /embed can still use it.
+    def unload(self):
+        with self._lock:
+            self.vector_store = None
+            self.lexical_index = None
+            self.metadata_index = None
+            self.chain_registry.clear()
+            self.loaded = False
+
+    def clear_uploads(self):
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.upload_index.clear()
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "loaded": self.loaded,
+            "version": self.version if self.loaded else None,
+            "chunks": self.vector_store.index.ntotal if self.vector_store is not None else None,
+            "uploaded_files": len(self.upload_index.snapshot()),
+            "error": self.error,
+        }
+
+
+# Named collections, created on first use and loaded lazily. At most
+# max_loaded collections keep their index open; beyond that, or while the
+# process uses more than memory_limit_bytes (measured with psutil, when
+# installed), the least recently used collections are unloaded.
+class CollectionManager:
+    def __init__(self, upload_root, store_root, create, max_loaded=8, memory_limit_bytes=0):
+        self.upload_root = upload_root
+        self.store_root = store_root
+        self._create = create
+        self.max_loaded = max_loaded
+        self.memory_limit_bytes = memory_limit_bytes
+        self.evictions = 0
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    # Function to return a collection, loading its index unless load is False
+    def get(self, name, load=True):
+        validate_collection_name(name)
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._create(name)
+                self._collections[name] = collection
+            collection.last_used = time.monotonic()
+        if load:
+            collection.ensure_loaded()
+            self._evict(keep=collection)
+        return collection
+
+    def _over_memory_limit(self):
+        if psutil is None or not self.memory_limit_bytes:
+            return False
+        return psutil.Process().memory_info().rss > self.memory_limit_bytes
+
+    def _evict(self, keep):
+        with self._lock:
+            loaded = sorted(
+                (c for c in self._collections.values() if c.loaded and c is not keep),
+                key=lambda c: c.last_used,
+            )
+        while loaded and (len(loaded) + 1 > self.max_loaded or self._over_memory_limit()):
+            collection = loaded.pop(0)
+            print(f"Unloading collection {collection.name!r}")
+            collection.unload()
+            self.evictions += 1
+
+    # Function to list every collection with saved versions or uploads, open or not
+    def names(self):
+        found = set(self._collections)
+        for root in (self.store_root, self.upload_root):
+            if os.path.isdir(root):
+                found.update(name for name in os.listdir(root) if COLLECTION_NAME_PATTERN.match(name) and os.path.isdir(os.path.join(root, name)))
+        return sorted(found)
+
+    # Function to list the collections opened by this process
+    def all(self):
+        with self._lock:
+            return list(self._collections.values())
+
+    def loaded(self):
+        with self._lock:
+            return [c for c in self._collections.values() if c.loaded]
+
+    def clear_uploads(self):
+        with self._lock:
+            collections = list(self._collections.values())
+        for collection in collections:
+            collection.clear_uploads()
+
+
+# Function to move a vector store saved before collections existed (with
+# CURRENT directly under the root) into the default collection's directory
+def migrate_single_store(store_root):
+    if not os.path.exists(os.path.join(store_root, "CURRENT")):
+        return
+    target = os.path.join(store_root, DEFAULT_COLLECTION)
+    if os.path.exists(os.path.join(target, "CURRENT")):
+        return
+    os.makedirs(target, exist_ok=True)
+    for name in os.listdir(store_root):
+        if name == "CURRENT" or (name.startswith("v") and name[1:].isdigit()):
+            os.replace(os.path.join(store_root, name), os.path.join(target, name))
+    print(f"Moved the existing vector store into collection {DEFAULT_COLLECTION!r}")
@@ -0,0 +1,134 @@
+import math
+import re
+import threading
+
+from langchain_core.documents import Document
+
+# Groq does not expose the Llama 3 tokenizer, so prompt size is estimated from
+# characters; about four characters per token holds for English prose
+CHARS_PER_TOKEN = 4.0
+# Chunks sharing at least this share of their word 5-grams are treated as duplicates
+DUPLICATE_SIMILARITY = 0.9
+SHINGLE_SIZE = 5
+# Longest overlap looked for between consecutive chunks (the splitter uses 200 characters)
+MAX_OVERLAP_CHARS = 400
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# Function to split a chunk id ("<file hash>:<n>") into its file and position
+def _chunk_position(doc):
+    file_hash, _, index = (doc.id or "").rpartition(":")
+    return (file_hash, int(index)) if index.isdigit() else (doc.id, None)
+
+
+# Function to join two consecutive chunks, removing the text they share
+def _merge_text(first, second):
+    for size in range(min(len(first), len(second), MAX_OVERLAP_CHARS), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+# Packs retrieved chunks into the prompt context:
+#   1. drops chunks that are near-duplicates of a more relevant one
+#   2. merges consecutive chunks of the same page into one passage, removing
+#      the text repeated by the splitter's chunk overlap
+#   3. adds passages in relevance order while they fit token_budget
+# pack() returns the passages and how many prompt tokens were saved.
+class ContextPacker:
+    def __init__(self, token_budget=3000):
+        self.token_budget = token_budget
+        self.queries = 0
+        self.tokens_retrieved = 0
+        self.tokens_packed = 0
+        self._lock = threading.Lock()
+
+    def pack(self, documents):
+        tokens_retrieved = sum(estimate_tokens(doc.page_content) for doc in documents)
+
+        kept, kept_shingles, duplicates = [], [], 0
+        for rank, doc in enumerate(documents):
+            shingles = _shingles(doc.page_content)
+            if any(_similarity(shingles, other) >= DUPLICATE_SIMILARITY for other in kept_shingles):
+                duplicates += 1
+                continue
+            kept.append((rank, doc))
+            kept_shingles.append(shingles)
+
+        # Group by file and page, then merge runs of consecutive chunk numbers
+        groups = {}
+        for rank, doc in kept:
+            file_hash, index = _chunk_position(doc)
+            groups.setdefault((file_hash, doc.metadata.get("page")), []).append((index, rank, doc))
+        passages = []
+        for members in groups.values():
+            members.sort(key=lambda member: (member[0] is None, member[0] or 0))
+            current = None
+            for index, rank, doc in members:
+                if current is not None and index is not None and current["last"] is not None and index == current["last"] + 1:
+                    current["text"] = _merge_text(current["text"], doc.page_content)
+                    current["rank"] = min(current["rank"], rank)
+                    current["ids"].append(doc.id)
+                    current["last"] = index
+                    continue
+                current = {"text": doc.page_content, "rank": rank, "ids": [doc.id], "last": index, "metadata": doc.metadata}
+                passages.append(current)
+        passages.sort(key=lambda passage: passage["rank"])
+
+        packed, used, over_budget = [], 0, 0
+        for passage in passages:
+            text = passage["text"]
+            tokens = estimate_tokens(text)
+            if used + tokens > self.token_budget:
+                if packed:
+                    over_budget += 1
+                    continue
+                # Never send an empty context: cut the most relevant passage to the budget
+                text = text[:int(self.token_budget * CHARS_PER_TOKEN)]
+                tokens = estimate_tokens(text)
+            used += tokens
+            packed.append(Document(
+                id=passage["ids"][0],
+                page_content=text,
+                metadata={**passage["metadata"], "chunk_ids": passage["ids"]},
+            ))
+
+        with self._lock:
+            self.queries += 1
+            self.tokens_retrieved += tokens_retrieved
+            self.tokens_packed += used
+        return packed, {
+            "tokens_retrieved": tokens_retrieved,
+            "tokens_packed": used,
+            "tokens_saved": tokens_retrieved - used,
+            "duplicates_dropped": duplicates,
+            "chunks_merged": len(kept) - len(passages),
+            "passages_over_budget": over_budget,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "queries": self.queries,
+                "tokens_retrieved": self.tokens_retrieved,
+                "tokens_packed": self.tokens_packed,
+                "tokens_saved": self.tokens_retrieved - self.tokens_packed,
+            }
@@ -0,0 +1,122 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_BATCH_SIZE = 500
+
+
+# Persistent chunk-embedding cache stored in a local SQLite file.
+# Entries are keyed by a hash of (model name, chunk text) and evicted in
+# least-recently-used order once the cache holds more than max_entries vectors.
+class EmbeddingCache:
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model_name, text):
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    # Function to fetch cached vectors for the given keys and mark them as recently used
+    def get_many(self, keys):
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+                batch = keys[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+                self._conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *batch]
+                )
+            self._conn.commit()
+        return found
+
+    # Function to store new vectors and evict the least recently used entries over the cap
+    def put_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items],
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+            }
+
+
+# Embeddings wrapper that serves chunk vectors from the cache and only sends
+# cache misses to the underlying model. Query embeddings are not cached.
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, model_name, cache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        keys = [EmbeddingCache.key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(list(set(keys)))
+
+        # Group positions by key so repeated chunks in one batch are embedded once
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in found:
+                missing.setdefault(key, []).append(i)
+
+        vectors = [found.get(key) for key in keys]
+        if missing:
+            missing_keys = list(missing)
+            new_vectors = self.embeddings.embed_documents([texts[missing[key][0]] for key in missing_keys])
+            for key, vector in zip(missing_keys, new_vectors):
+                for i in missing[key]:
+                    vectors[i] = list(vector)
+            self.cache.put_many(zip(missing_keys, new_vectors))
+
+        self.cache.record(hits=len(texts) - len(missing), misses=len(missing))
+        return vectors
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
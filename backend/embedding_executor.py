@@ -0,0 +1,129 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from context_packer import estimate_tokens
+
+# Sequence length assumed when the model does not report one
+DEFAULT_MAX_SEQ_LENGTH = 512
+
+
+# Function to set how many threads the model uses inside each forward pass
+# (0 keeps the library default, usually one per core). Process-wide, so it
+# also applies to query embeddings. Only affects torch; the ONNX backends take
+# their thread count from EmbeddingModelManager(intra_op_threads=...).
+def set_intra_op_threads(threads):
+    if threads > 0:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def _is_out_of_memory(error):
+    return isinstance(error, MemoryError) or "out of memory" in str(error).lower()
+
+
+# Embeds chunks in batches sized to a memory target instead of a fixed count.
+#
+# Texts are sorted by estimated token length so each batch holds texts of
+# similar length and little compute is spent on padding. Batches are then
+# filled while (texts in batch) x (longest text) stays within max_batch_tokens,
+# so batches of short chunks are large and batches of long chunks are small,
+# keeping activation memory roughly constant. A batch that runs out of memory
+# halves max_batch_tokens and is retried in smaller pieces. Up to `workers`
+# batches run at once; each uses the model's intra-op threads (see
+# set_intra_op_threads). Vectors are returned in the order of the input texts.
+class BatchedEmbeddingExecutor(Embeddings):
+    def __init__(self, model_manager, max_batch_tokens=16384, max_batch_size=256, workers=1):
+        self.model_manager = model_manager
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.workers = workers
+        self.chunks = 0
+        self.batches = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+        self.seconds = 0.0
+        self.oom_retries = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") if workers > 1 else None
+
+    def _max_seq_length(self):
+        client = getattr(self.model_manager.model, "_client", None)
+        return getattr(client, "max_seq_length", None) or DEFAULT_MAX_SEQ_LENGTH
+
+    # Function to split positions sorted by length into batches within the token budget
+    def _plan(self, order, lengths):
+        batches, batch = [], []
+        for position in order:
+            # Lengths ascend, so the newest text sets the padded length of the batch
+            if batch and ((len(batch) + 1) * lengths[position] > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch = []
+            batch.append(position)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, texts, positions, lengths):
+        try:
+            vectors = self.model_manager.model.embed_documents([texts[position] for position in positions])
+        except (MemoryError, RuntimeError) as e:
+            if not _is_out_of_memory(e) or len(positions) == 1:
+                raise
+            with self._lock:
+                self.max_batch_tokens = max(1, self.max_batch_tokens // 2)
+                self.oom_retries += 1
+            print(f"Embedding batch of {len(positions)} chunks ran out of memory, lowering the batch budget to {self.max_batch_tokens} tokens")
+            vectors = []
+            for batch in self._plan(positions, lengths):
+                vectors.extend(self._embed_batch(texts, batch, lengths))
+            return vectors
+        with self._lock:
+            self.batches += 1
+            self.padded_tokens += len(positions) * lengths[positions[-1]]
+        return vectors
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        max_seq_length = self._max_seq_length()
+        lengths = [min(estimate_tokens(text) + 2, max_seq_length) for text in texts]  # +2 for [CLS] and [SEP]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        batches = self._plan(order, lengths)
+
+        start = time.perf_counter()
+        if self._pool is not None and len(batches) > 1:
+            results = list(self._pool.map(lambda batch: self._embed_batch(texts, batch, lengths), batches))
+        else:
+            results = [self._embed_batch(texts, batch, lengths) for batch in batches]
+        elapsed = time.perf_counter() - start
+
+        vectors = [None] * len(texts)
+        for batch, batch_vectors in zip(batches, results):
+            for position, vector in zip(batch, batch_vectors):
+                vectors[position] = vector
+        with self._lock:
+            self.chunks += len(texts)
+            self.tokens += sum(lengths)
+            self.seconds += elapsed
+        return vectors
+
+    def embed_query(self, text):
+        return self.model_manager.model.embed_query(text)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chunks": self.chunks,
+                "batches": self.batches,
+                "seconds": round(self.seconds, 3),
+                "chunks_per_second": round(self.chunks / self.seconds, 1) if self.seconds else 0.0,
+                "padding_ratio": round(1 - self.tokens / self.padded_tokens, 4) if self.padded_tokens else 0.0,
+                "max_batch_tokens": self.max_batch_tokens,
+                "max_batch_size": self.max_batch_size,
+                "workers": self.workers,
+                "oom_retries": self.oom_retries,
+            }
@@ -0,0 +1,124 @@
+import importlib.util
+import os
+import re
+import threading
+
+from langchain_huggingface import HuggingFaceEmbeddings
+
+# How the embedding model runs on the CPU:
+#   torch      the sentence-transformers PyTorch model (float32)
+#   onnx       the same weights exported to ONNX and run with onnxruntime
+#   onnx_int8  the ONNX export with dynamically quantized int8 weights
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx_int8")
+# Instruction set the int8 kernels are quantized for: arm64, avx2, avx512 or avx512_vnni
+DEFAULT_QUANTIZATION = "avx2"
+
+
+# Raised when a saved index was built with a different embedding model or dimension
+class IncompatibleIndexError(Exception):
+    pass
+
+
+# Function to export a sentence-transformers model to ONNX (and, for int8, to
+# quantize it) under export_root once, returning the directory and the model
+# file to load. Later loads reuse the export, so they work offline.
+def export_onnx_model(model_name, backend, export_root, quantization=DEFAULT_QUANTIZATION):
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    directory = os.path.join(export_root, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+    if not os.path.exists(os.path.join(directory, "onnx", "model.onnx")):
+        print(f"Exporting {model_name} to ONNX in {directory}")
+        SentenceTransformer(model_name, backend="onnx").save_pretrained(directory)
+    if backend != "onnx_int8":
+        return directory, "onnx/model.onnx"
+
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(directory, file_name)):
+        print(f"Quantizing {model_name} to int8 for {quantization}")
+        model = SentenceTransformer(directory, backend="onnx")
+        export_dynamic_quantized_onnx_model(model, quantization, directory)
+    return directory, file_name
+
+
+# Loads the configured embedding model once and hands the same instance to
+# indexing and retrieval, so query vectors always match the index vectors.
+# encode_batch_size is the most texts the model encodes in one forward pass.
+# intra_op_threads (0 keeps onnxruntime's default) sets the threads of the ONNX
+# session; torch threads are set process-wide by set_intra_op_threads.
+# The ONNX backends keep the HuggingFaceEmbeddings interface, so the executor,
+# caches and retrievers work unchanged.
+class EmbeddingModelManager:
+    def __init__(self, model_name, encode_batch_size=32, backend="torch", export_root="onnx_models",
+                 quantization=DEFAULT_QUANTIZATION, intra_op_threads=0):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}.")
+        self.model_name = model_name
+        self.encode_batch_size = encode_batch_size
+        self.backend = backend
+        self.export_root = export_root
+        self.quantization = quantization
+        self.intra_op_threads = intra_op_threads
+        self._model = None
+        self._dimension = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        encode_kwargs = {"batch_size": self.encode_batch_size}
+        if self.backend == "torch":
+            return HuggingFaceEmbeddings(model_name=self.model_name, encode_kwargs=encode_kwargs)
+        if importlib.util.find_spec("onnxruntime") is None or importlib.util.find_spec("optimum") is None:
+            raise RuntimeError(
+                f"EMBEDDING_BACKEND={self.backend} needs onnxruntime and optimum: "
+                "pip install 'sentence-transformers[onnx]'"
+            )
+        directory, file_name = export_onnx_model(self.model_name, self.backend, self.export_root, self.quantization)
+        onnx_kwargs = {"file_name": file_name}
+        if self.intra_op_threads > 0:
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.intra_op_threads
+            onnx_kwargs["session_options"] = session_options
+        return HuggingFaceEmbeddings(
+            model_name=directory,
+            model_kwargs={"backend": "onnx", "model_kwargs": onnx_kwargs},
+            encode_kwargs=encode_kwargs,
+        )
+
+    # Name the vectors of this model and backend are cached under; int8 vectors
+    # differ slightly from float32 ones, so they must not share cache entries
+    @property
+    def cache_name(self):
+        return self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+
+    @property
+    def dimension(self):
+        if self._dimension is None:
+            self._dimension = len(self.model.embed_query("dimension probe"))
+        return self._dimension
+
+    # Function to load the weights and run one forward pass before the first request
+    def warm(self):
+        return self.dimension
+
+    def describe(self):
+        return {"model_name": self.model_name, "dimension": self.dimension, "backend": self.backend}
+
+    # Function to refuse an index built with another model, backend or vector size.
+    # Indexes saved before backends existed were built with torch.
+    def check_compatible(self, info):
+        backend = info.get("backend", "torch")
+        if info.get("model_name") != self.model_name or info.get("dimension") != self.dimension or backend != self.backend:
+            raise IncompatibleIndexError(
+                f"The saved index was built with model {info.get('model_name')!r} on {backend} "
+                f"(dimension {info.get('dimension')}), but the server uses {self.model_name!r} on {self.backend} "
+                f"(dimension {self.dimension}). Please call /embed?full=true to rebuild it."
+            )
@@ -0,0 +1,266 @@
+import os
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from quantization import STORAGE_TYPES, RerankedIndex, raw_index
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# k-means wants roughly this many training points per IVF list
+MIN_POINTS_PER_LIST = 39
+
+SCALAR_QUANTIZERS = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+# Which FAISS index /embed builds and how it is searched. Every field can be
+# set from the environment, e.g. INDEX_TYPE=ivf_pq IVF_NPROBE=32.
+# `storage` compresses the stored vectors (float16, sq8 or pq); compressed
+# indexes re-rank the top rerank_factor * k candidates with exact float32 vectors.
+class IndexConfig:
+    def __init__(self, index_type="flat", nlist=1024, pq_m=16, pq_nbits=8, hnsw_m=32,
+                 ef_construction=200, nprobe=16, ef_search=64, train_sample=100000,
+                 storage="float32", rerank_factor=4):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}.")
+        if storage not in STORAGE_TYPES:
+            raise ValueError(f"Unknown vector storage {storage!r}; expected one of {', '.join(STORAGE_TYPES)}.")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.train_sample = train_sample
+        self.storage = storage
+        self.rerank_factor = rerank_factor
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            index_type=os.getenv("INDEX_TYPE", "flat").lower(),
+            nlist=int(os.getenv("IVF_NLIST", "1024")),
+            pq_m=int(os.getenv("PQ_M", "16")),
+            pq_nbits=int(os.getenv("PQ_NBITS", "8")),
+            hnsw_m=int(os.getenv("HNSW_M", "32")),
+            ef_construction=int(os.getenv("HNSW_EF_CONSTRUCTION", "200")),
+            nprobe=int(os.getenv("IVF_NPROBE", "16")),
+            ef_search=int(os.getenv("HNSW_EF_SEARCH", "64")),
+            train_sample=int(os.getenv("INDEX_TRAIN_SAMPLE", "100000")),
+            storage=os.getenv("VECTOR_STORAGE", "float32").lower(),
+            rerank_factor=int(os.getenv("RERANK_FACTOR", "4")),
+        )
+
+
+# Function to create (and train, for IVF types) an empty index for the given
+# vectors. Corpora too small to train the requested type fall back to a flat index.
+def build_index(dimension, config, training_vectors):
+    vectors = np.ascontiguousarray(training_vectors, dtype=np.float32)
+    count = len(vectors)
+    storage = "pq" if config.index_type == "ivf_pq" else config.storage
+    pq_trainable = count >= 2 ** config.pq_nbits and dimension % config.pq_m == 0
+    if storage == "pq" and not pq_trainable:
+        print(f"Too few vectors ({count}) to train product quantization, storing float32 vectors.")
+        storage = "float32"
+    if storage in SCALAR_QUANTIZERS and count == 0:
+        storage = "float32"
+
+    if config.index_type == "hnsw":
+        if storage in SCALAR_QUANTIZERS:
+            index = faiss.IndexHNSWSQ(dimension, SCALAR_QUANTIZERS[storage], config.hnsw_m)
+        elif storage == "pq":
+            index = faiss.IndexHNSWPQ(dimension, config.pq_m, config.hnsw_m)
+        else:
+            index = faiss.IndexHNSWFlat(dimension, config.hnsw_m)
+        index.hnsw.efConstruction = config.ef_construction
+    elif config.index_type in ("ivf_flat", "ivf_pq"):
+        nlist = min(config.nlist, count // MIN_POINTS_PER_LIST)
+        if nlist < 1:
+            print(f"Too few vectors ({count}) to train a {config.index_type} index, using a flat index.")
+            return _flat_index(dimension, storage, config)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if storage in SCALAR_QUANTIZERS:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, SCALAR_QUANTIZERS[storage])
+        elif storage == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, config.pq_m, config.pq_nbits)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    else:
+        index = _flat_index(dimension, storage, config)
+
+    if not index.is_trained:
+        # Train on a random sample rather than the whole corpus
+        if count > config.train_sample:
+            rows = np.random.default_rng(0).choice(count, config.train_sample, replace=False)
+            vectors = vectors[np.sort(rows)]
+        index.train(vectors)
+    apply_search_params(index, config)
+    return index
+
+
+def _flat_index(dimension, storage, config):
+    if storage in SCALAR_QUANTIZERS:
+        return faiss.IndexScalarQuantizer(dimension, SCALAR_QUANTIZERS[storage])
+    if storage == "pq":
+        return faiss.IndexPQ(dimension, config.pq_m, config.pq_nbits)
+    return faiss.IndexFlatL2(dimension)
+
+
+# Function to build an index and, for compressed storage, pair it with the
+# float32 vectors used for exact re-ranking
+def new_index(dimension, config, training_vectors):
+    index = build_index(dimension, config, training_vectors)
+    if describe_storage(index) != "float32":
+        return RerankedIndex(index, np.empty((0, dimension), dtype=np.float32), config.rerank_factor)
+    return index
+
+
+def _ivf(index):
+    ivf = faiss.try_extract_index_ivf(index)
+    return faiss.downcast_index(ivf) if ivf is not None else None
+
+
+# Function to read back every stored vector. IVF indexes need a direct map
+# from id to list position before they can reconstruct.
+def _all_vectors(index):
+    if not isinstance(index, RerankedIndex):
+        ivf = _ivf(index)
+        if ivf is not None:
+            ivf.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# Function to set the query-time knobs (nprobe, efSearch) on a built or loaded index
+def apply_search_params(index, config):
+    if isinstance(index, RerankedIndex):
+        index.rerank_factor = config.rerank_factor
+    index = raw_index(index)
+    ivf = _ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config.nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config.ef_search
+
+
+# Function to build per-query search parameters restricted to a selector, carrying
+# over the index's own nprobe / efSearch (the parameter objects default to 1 and 16)
+def search_parameters(index, selector):
+    index = raw_index(index)
+    ivf = _ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+# Function to tell whether an index can restrict a search with an ID selector.
+# IndexPQ (flat index with pq storage) rejects any selector, including in SearchParametersPQ.
+def supports_selector(index):
+    return not isinstance(raw_index(index), faiss.IndexPQ)
+
+
+def describe_index(index):
+    index = raw_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    ivf = _ivf(index)
+    if isinstance(ivf, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if ivf is not None:
+        return "ivf_flat"
+    return "flat"
+
+
+def describe_storage(index):
+    index = raw_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    index = _ivf(index) or index
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if hasattr(index, "sq"):
+        return "float16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "float32"
+
+
+# Function to build a new vector store around an index trained for these vectors
+def create_vector_store(embedding, text_embeddings, metadatas, ids, config):
+    vectors = np.asarray([vector for _, vector in text_embeddings], dtype=np.float32)
+    index = new_index(vectors.shape[1], config, vectors)
+    vector_store = FAISS(
+        embedding_function=embedding,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vector_store
+
+
+# Function to tell whether an index type has to be trained before vectors are added
+def needs_training(config):
+    return config.index_type in ("ivf_flat", "ivf_pq") or config.storage != "float32"
+
+
+# Builds or extends a vector store from batches of embeddings as they are
+# produced. A new store is created from the first batch; index types that need
+# training (IVF, PQ and scalar-quantized storage) instead buffer batches until
+# config.train_sample vectors (or the whole corpus, if smaller) are available
+# and train on those. Later batches go straight into the index.
+class VectorStoreBuilder:
+    def __init__(self, embedding, config, vector_store=None):
+        self.embedding = embedding
+        self.config = config
+        self.vector_store = vector_store
+        self._pending = []
+        self._pending_count = 0
+
+    def add(self, texts, vectors, metadatas, ids):
+        if self.vector_store is not None:
+            self.vector_store.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+            return
+        self._pending.append((texts, vectors, metadatas, ids))
+        self._pending_count += len(ids)
+        if not needs_training(self.config) or self._pending_count >= self.config.train_sample:
+            self._create()
+
+    def _create(self):
+        text_embeddings = [pair for texts, vectors, _, _ in self._pending for pair in zip(texts, vectors)]
+        metadatas = [metadata for _, _, batch, _ in self._pending for metadata in batch]
+        ids = [chunk_id for _, _, _, batch in self._pending for chunk_id in batch]
+        self._pending = []
+        self.vector_store = create_vector_store(self.embedding, text_embeddings, metadatas, ids, self.config)
+
+    # Function to return the store, creating it from the buffered batches if
+    # training never reached train_sample (None when nothing was added)
+    def finish(self):
+        if self.vector_store is None and self._pending:
+            self._create()
+        return self.vector_store
+
+
+# Function to remove chunks from a vector store. Only flat indexes remove
+# vectors in place: HNSW cannot remove them, and IVF's remove_ids leaves gaps
+# in the ids, so they would no longer match the docstore rows (or the float32
+# rows of a RerankedIndex). Both are rebuilt from the remaining vectors.
+def delete_vectors(vector_store, ids, config):
+    if describe_index(vector_store.index) == "flat":
+        vector_store.delete(ids)
+        return
+
+    dropped = set(ids)
+    keep = [(row, doc_id) for row, doc_id in sorted(vector_store.index_to_docstore_id.items()) if doc_id not in dropped]
+    vectors = _all_vectors(vector_store.index)[[row for row, _ in keep]]
+    index = new_index(vector_store.index.d, config, vectors)
+    index.add(vectors)
+    vector_store.index = index
+    vector_store.docstore = InMemoryDocstore({doc_id: vector_store.docstore.search(doc_id) for _, doc_id in keep})
+    vector_store.index_to_docstore_id = {row: doc_id for row, (_, doc_id) in enumerate(keep)}
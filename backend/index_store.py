@@ -0,0 +1,294 @@
+import json
+import os
+import shutil
+from collections.abc import Mapping
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from index_factory import describe_index, describe_storage
+from lexical_index import LexicalIndex
+from metadata_index import MetadataIndex
+from quantization import RerankedIndex, raw_index
+
+# On-disk layout of the vector store:
+#
+#   <root>/CURRENT                 name of the live version directory
+#   <root>/v<N>/index.faiss        raw FAISS index
+#   <root>/v<N>/vectors.npy        float32 vectors for re-ranking, only for compressed indexes
+#   <root>/v<N>/ids.npy            chunk id of every index row (fixed-width bytes)
+#   <root>/v<N>/ids_sorted.npy     the same ids sorted, with ids_order.npy mapping back to rows
+#   <root>/v<N>/texts.bin          chunk texts, concatenated, addressed by texts_offsets.npy
+#   <root>/v<N>/metadata.bin       chunk metadata as JSON, addressed by metadata_offsets.npy
+#   <root>/v<N>/info.json          row count, index type, embedding model and FAISS wrapper settings
+#   <root>/v<N>/manifest.json      files and chunk ids contained in this version
+#   <root>/v<N>/lexical/           BM25 inverted index over the chunk texts (see lexical_index.py)
+#   <root>/v<N>/filters/           chunk metadata by row for filtered search (see metadata_index.py)
+#
+# Every array is memory-mapped on load, so startup does not depend on corpus size
+# and several worker processes share the same pages through the OS page cache.
+# Each save writes a new version directory, so readers never see a partial store.
+FORMAT_VERSION = 1
+KEEP_VERSIONS = 2
+# Re-ranking factor of loaded compressed indexes until apply_search_params sets the configured one
+DEFAULT_RERANK_FACTOR = 4
+
+
+def version_dir(root, version):
+    return os.path.join(root, f"v{version}")
+
+
+def manifest_path(root, version):
+    return os.path.join(version_dir(root, version), "manifest.json")
+
+
+def lexical_dir(directory):
+    return os.path.join(directory, "lexical")
+
+
+def filters_dir(directory):
+    return os.path.join(directory, "filters")
+
+
+def current_version(root):
+    try:
+        with open(os.path.join(root, "CURRENT"), "r") as f:
+            return int(f.read().strip().lstrip("v"))
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+# A column of variable-length strings stored in one file and addressed by offsets
+class _BlobColumn:
+    def __init__(self, directory, name):
+        data_path = os.path.join(directory, f"{name}.bin")
+        if os.path.getsize(data_path):
+            self.data = np.memmap(data_path, dtype=np.uint8, mode="r")
+        else:
+            self.data = np.empty(0, dtype=np.uint8)
+        self.offsets = np.load(os.path.join(directory, f"{name}_offsets.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+
+def _write_blob_column(directory, name, values):
+    offsets = [0]
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        for value in values:
+            encoded = value.encode("utf-8")
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    np.save(os.path.join(directory, f"{name}_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+
+# Read-only docstore over the memory-mapped chunk files of one version
+class MappedDocstore(Docstore):
+    def __init__(self, directory):
+        self.ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode="r")
+        self.sorted_ids = np.load(os.path.join(directory, "ids_sorted.npy"), mmap_mode="r")
+        self.sorted_order = np.load(os.path.join(directory, "ids_order.npy"), mmap_mode="r")
+        self.texts = _BlobColumn(directory, "texts")
+        self.metadata = _BlobColumn(directory, "metadata")
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Function to find the index row of a chunk id with a binary search over the sorted ids
+    def row(self, doc_id):
+        key = doc_id.encode("utf-8")
+        position = int(np.searchsorted(self.sorted_ids, key))
+        if position < len(self.sorted_ids) and self.sorted_ids[position] == key:
+            return int(self.sorted_order[position])
+        return None
+
+    def document(self, row):
+        return Document(
+            id=self.ids[row].decode("utf-8"),
+            page_content=self.texts[row],
+            metadata=json.loads(self.metadata[row]),
+        )
+
+    def search(self, search):
+        row = self.row(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self.document(row)
+
+    def add(self, texts):
+        raise NotImplementedError("Memory-mapped vector stores are read-only. Call materialize() first.")
+
+    def delete(self, ids):
+        raise NotImplementedError("Memory-mapped vector stores are read-only. Call materialize() first.")
+
+
+# Maps index rows to chunk ids without building a dictionary of the whole corpus
+class _RowIdMap(Mapping):
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __getitem__(self, row):
+        if not 0 <= row < len(self.ids):
+            raise KeyError(row)
+        return self.ids[row].decode("utf-8")
+
+    def __iter__(self):
+        return iter(range(len(self.ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _read_faiss_index(path):
+    # IO_FLAG_MMAP_IFC maps the stored codes of flat, scalar-quantized, PQ, HNSW
+    # and IVF indexes straight from the file, so workers share the pages instead
+    # of each reading a private copy. IO_FLAG_MMAP alone does not map IndexFlat.
+    # Mapped codes cannot grow; materialize() makes an owned copy before updates.
+    for flags in (getattr(faiss, "IO_FLAG_MMAP_IFC", None), faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_READ_ONLY", 0)):
+        if flags is None:
+            continue
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
+
+
+# Function to write a vector store as a new version and make it the current one
+def save_index(vector_store, root, manifest, model_info, lexical_index=None):
+    os.makedirs(root, exist_ok=True)
+    version = current_version(root) + 1
+    target = version_dir(root, version)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    rows = range(vector_store.index.ntotal)
+    ids = [vector_store.index_to_docstore_id[row] for row in rows]
+    documents = [vector_store.docstore.search(doc_id) for doc_id in ids]
+
+    faiss.write_index(raw_index(vector_store.index), os.path.join(staging, "index.faiss"))
+    if isinstance(vector_store.index, RerankedIndex):
+        np.save(os.path.join(staging, "vectors.npy"), np.asarray(vector_store.index.vectors, dtype=np.float32))
+    encoded_ids = np.array([doc_id.encode("utf-8") for doc_id in ids] or [b""], dtype=np.bytes_)[:len(ids)]
+    order = np.argsort(encoded_ids, kind="stable")
+    np.save(os.path.join(staging, "ids.npy"), encoded_ids)
+    np.save(os.path.join(staging, "ids_sorted.npy"), encoded_ids[order])
+    np.save(os.path.join(staging, "ids_order.npy"), order.astype(np.int64))
+    _write_blob_column(staging, "texts", (doc.page_content for doc in documents))
+    _write_blob_column(staging, "metadata", (json.dumps(doc.metadata) for doc in documents))
+
+    with open(os.path.join(staging, "info.json"), "w") as f:
+        json.dump({
+            "format": FORMAT_VERSION,
+            "version": version,
+            "count": len(ids),
+            "index_type": describe_index(vector_store.index),
+            "storage": describe_storage(vector_store.index),
+            "model_name": model_info["model_name"],
+            "dimension": model_info["dimension"],
+            "backend": model_info["backend"],
+            "normalize_L2": vector_store._normalize_L2,
+            "distance_strategy": vector_store.distance_strategy.value,
+        }, f)
+    with open(os.path.join(staging, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    MetadataIndex.save(filters_dir(staging), [doc.metadata for doc in documents])
+    if lexical_index is not None:
+        lexical_index.save(lexical_dir(staging), ids)
+
+    os.replace(staging, target)
+    pointer = os.path.join(root, "CURRENT.tmp")
+    with open(pointer, "w") as f:
+        f.write(f"v{version}")
+    os.replace(pointer, os.path.join(root, "CURRENT"))
+
+    # Older versions may still be mapped by other workers, so removal is best effort
+    for name in os.listdir(root):
+        if name.startswith("v") and name[1:].isdigit() and int(name[1:]) <= version - KEEP_VERSIONS:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return version
+
+
+# Function to open the current version. Returns (vector_store, version, manifest),
+# or (None, 0, None) when nothing has been saved yet. Raises IncompatibleIndexError
+# when the index was built with a different embedding model or dimension.
+def load_index(root, embedding_model):
+    version = current_version(root)
+    if not version:
+        return None, 0, None
+    directory = version_dir(root, version)
+    with open(os.path.join(directory, "info.json"), "r") as f:
+        info = json.load(f)
+    with open(os.path.join(directory, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+
+    embedding_model.check_compatible(info)
+    index = _read_faiss_index(os.path.join(directory, "index.faiss"))
+    embedding_model.check_compatible({**info, "dimension": index.d})
+    vectors_path = os.path.join(directory, "vectors.npy")
+    if os.path.exists(vectors_path):
+        index = RerankedIndex(index, np.load(vectors_path, mmap_mode="r"), DEFAULT_RERANK_FACTOR)
+
+    docstore = MappedDocstore(directory)
+    vector_store = FAISS(
+        embedding_function=embedding_model.model,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=_RowIdMap(docstore.ids),
+        normalize_L2=info["normalize_L2"],
+        distance_strategy=DistanceStrategy(info["distance_strategy"]),
+    )
+    return vector_store, version, manifest
+
+
+# Function to open the BM25 index saved with a version, or None for versions
+# saved before hybrid search existed
+def load_lexical_index(root, version):
+    directory = lexical_dir(version_dir(root, version))
+    if not version or not os.path.exists(os.path.join(directory, "stats.json")):
+        return None
+    return LexicalIndex.load(directory)
+
+
+# Function to open the metadata filter index saved with a version, or None for
+# versions saved before filtered search existed
+def load_metadata_index(root, version):
+    directory = filters_dir(version_dir(root, version))
+    if not version or not os.path.exists(os.path.join(directory, "page.npy")):
+        return None
+    return MetadataIndex.load(directory)
+
+
+# Function to copy a memory-mapped vector store into a writable in-memory one
+def materialize(vector_store):
+    if not isinstance(vector_store.docstore, MappedDocstore):
+        return vector_store
+    docstore = vector_store.docstore
+    # clone_index would keep viewing the mapped codes, which abort on add, so
+    # round-trip through serialization to get an index that owns its data
+    index = faiss.deserialize_index(faiss.serialize_index(raw_index(vector_store.index)))
+    if isinstance(vector_store.index, RerankedIndex):
+        index = RerankedIndex(index, np.array(vector_store.index.vectors), vector_store.index.rerank_factor)
+    documents = {}
+    index_to_docstore_id = {}
+    for row in range(len(docstore)):
+        document = docstore.document(row)
+        documents[document.id] = document
+        index_to_docstore_id[row] = document.id
+    return FAISS(
+        embedding_function=vector_store.embedding_function,
+        index=index,
+        docstore=InMemoryDocstore(documents),
+        index_to_docstore_id=index_to_docstore_id,
+        normalize_L2=vector_store._normalize_L2,
+        distance_strategy=vector_store.distance_strategy,
+    )
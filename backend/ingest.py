@@ -0,0 +1,234 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from itertools import islice
+
+from langchain_core.documents import Document
+
+from pdf_text import extract_pages
+
+# Read files in 1 MB blocks when hashing so large PDFs never sit in memory
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# Function to hash the content of a file
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# The manifest records which files are in the vector store:
+#   "files":     relative path -> {"hash", "size", "mtime"}
+#   "documents": content hash  -> list of chunk ids stored in the index
+def empty_manifest():
+    return {"files": {}, "documents": {}}
+
+
+def save_manifest(manifest, path):
+    # Write to a temporary file first so a crash never leaves a half-written manifest
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def _pdf_paths(directory, names):
+    if names is not None:
+        for relative_path in sorted(names):
+            if relative_path.lower().endswith(".pdf") and os.path.isfile(os.path.join(directory, relative_path)):
+                yield relative_path
+        return
+    for root, _, file_names in os.walk(directory):
+        for name in sorted(file_names):
+            if name.lower().endswith(".pdf"):
+                yield os.path.relpath(os.path.join(root, name), directory)
+
+
+# Function to hash every PDF in the directory. Files whose size and mtime match
+# the manifest (or known_files, e.g. hashes computed during upload) keep their
+# recorded hash, so they are not read again. `names` restricts the scan to the
+# given relative paths.
+def scan_directory(directory, manifest, known_files=None, names=None):
+    known_files = known_files or {}
+    corpus = {}
+    for relative_path in _pdf_paths(directory, names):
+        path = os.path.join(directory, relative_path)
+        stat = os.stat(path)
+        file_hash = None
+        for known in (manifest["files"].get(relative_path), known_files.get(relative_path)):
+            if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+                file_hash = known["hash"]
+                break
+        if file_hash is None:
+            file_hash = file_sha256(path)
+        corpus[relative_path] = {"hash": file_hash, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    return corpus
+
+
+# Function to map each content hash in the corpus to the file it is indexed
+# under. Identical content uploaded under two names is embedded only once, as
+# the first of those names.
+def live_paths(corpus):
+    live_hashes = {}
+    for relative_path, entry in sorted(corpus.items()):
+        live_hashes.setdefault(entry["hash"], relative_path)
+    return live_hashes
+
+
+# Function to compare the directory against the manifest.
+# Returns the files that still need embedding (content hash -> relative path)
+# and the chunk ids of files that were deleted or changed.
+def plan_changes(manifest, corpus):
+    indexed_hashes = set(manifest["documents"])
+    live_hashes = live_paths(corpus)
+
+    to_embed = {h: path for h, path in live_hashes.items() if h not in indexed_hashes}
+    stale_ids = []
+    for file_hash in sorted(indexed_hashes - set(live_hashes)):
+        stale_ids.extend(manifest["documents"][file_hash])
+    return to_embed, stale_ids
+
+
+# Chunk ids are derived from the content hash so the same file always maps to the same ids
+def chunk_id(file_hash, index):
+    return f"{file_hash}:{index}"
+
+
+# Function to parse a single PDF into page texts and also return how long
+# parsing took, measured inside the worker so pool queueing is not counted. It
+# runs inside worker processes, so it has to stay a module-level function.
+def _timed_parse_pdf(path, backend):
+    start = time.perf_counter()
+    texts = extract_pages(path, backend)
+    return texts, time.perf_counter() - start
+
+
+# Function to turn page texts into one Document per page, with the same
+# metadata PyPDFLoader produced
+def page_documents(path, texts):
+    return [Document(page_content=text, metadata={"source": path, "page": page}) for page, text in enumerate(texts)]
+
+
+# Parse worker processes, started once and reused by every /embed. They are
+# spawned rather than forked: the server runs model, event loop and job
+# threads, and forking a multi-threaded process can deadlock the child.
+# A spawned worker re-runs the main script's module-level code (all of app.py
+# when started with `python app.py`), so app.py's imports are kept light:
+# torch and sentence-transformers are only imported when a model is loaded.
+_parse_pool = None
+_parse_pool_workers = 0
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool(workers):
+    global _parse_pool, _parse_pool_workers
+    with _parse_pool_lock:
+        if _parse_pool is None or _parse_pool_workers != workers:
+            if _parse_pool is not None:
+                _parse_pool.shutdown(wait=False, cancel_futures=True)
+            _parse_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _parse_pool_workers = workers
+        return _parse_pool
+
+
+# Function to stop the parse workers, on shutdown or after a worker died
+def shutdown_parse_pool(wait=True):
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(wait=wait, cancel_futures=True)
+            _parse_pool = None
+
+
+# Function to parse files in order with at most `window` of them submitted to
+# the pool at a time. A new file is only submitted when the consumer takes a
+# result, so parsed pages never pile up ahead of the splitter and embedder.
+def _parse_uncached(paths, workers, backend, window):
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield _timed_parse_pdf(path, backend)
+        return
+    executor = _get_parse_pool(workers)
+    remaining = iter(paths)
+    pending = deque()
+    try:
+        pending.extend(executor.submit(_timed_parse_pdf, path, backend) for path in islice(remaining, window))
+        while pending:
+            result = pending.popleft().result()
+            path = next(remaining, None)
+            if path is not None:
+                pending.append(executor.submit(_timed_parse_pdf, path, backend))
+            yield result
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time
+        shutdown_parse_pool(wait=False)
+        raise
+    finally:
+        # The consumer stopped early or failed: drop the files not started yet
+        for future in pending:
+            future.cancel()
+
+
+# Function to parse PDFs across a process pool. `files` lists (path, file hash)
+# pairs. Pages are yielded per file in the order of `files` as soon as that file
+# is parsed, so the splitter can start on the first files while later ones are
+# still being parsed, and the output order is the same as parsing serially.
+# At most `window` files (default two per worker) are parsed ahead of the consumer.
+# Files in text_cache are read from it instead of being parsed, and newly parsed
+# files are added to it. Yields (path, pages, parse seconds or None when cached).
+def parse_pdfs(files, workers, backend, text_cache=None, window=None):
+    cached = text_cache.cached_files([file_hash for _, file_hash in files], backend) if text_cache is not None else set()
+    uncached = [path for path, file_hash in files if file_hash not in cached]
+    parsed = _parse_uncached(uncached, workers, backend, window or 2 * max(1, workers))
+    for path, file_hash in files:
+        if file_hash in cached:
+            texts = text_cache.get(file_hash)
+            if texts is not None:
+                yield path, page_documents(path, texts), None
+                continue
+            # Evicted since cached_files was called: parse it now instead
+            texts, seconds = next(_parse_uncached([path], workers, backend, 1))
+        else:
+            texts, seconds = next(parsed)
+        if text_cache is not None:
+            text_cache.put(file_hash, texts, backend)
+        yield path, page_documents(path, texts), seconds
+
+
+# Function to split the pages of one file into chunks with stable ids
+def split_pages(pages, file_hash, text_splitter):
+    chunks = text_splitter.split_documents(pages)
+    ids = [chunk_id(file_hash, i) for i in range(len(chunks))]
+    return chunks, ids
+
+
+# Function to group an iterable into lists of up to `size` items, pulling only
+# one batch at a time from upstream
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# Function to build the manifest describing the index after an update
+def updated_manifest(manifest, corpus, embedded_ids):
+    documents = {}
+    for entry in corpus.values():
+        file_hash = entry["hash"]
+        if file_hash in embedded_ids:
+            documents[file_hash] = embedded_ids[file_hash]
+        elif file_hash in manifest["documents"]:
+            documents[file_hash] = manifest["documents"][file_hash]
+    return {"files": corpus, "documents": documents}
@@ -0,0 +1,98 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs kept around so clients can still read their result
+MAX_FINISHED_JOBS = 100
+
+
+# Progress of one background embedding job. The worker thread updates the
+# counters while it runs; /jobs/{id} reads them through to_dict().
+class EmbedJob:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.files_total = 0
+        self.files_parsed = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.result = None
+        self.error = None
+
+    # Parsing and embedding count as equal halves of the work
+    def progress(self):
+        if self.status == "completed":
+            return 1.0
+        parsed = self.files_parsed / self.files_total if self.files_total else 0.0
+        embedded = self.chunks_embedded / self.chunks_total if self.chunks_total else 0.0
+        return 0.5 * parsed + 0.5 * embedded
+
+    def eta_seconds(self):
+        if self.status != "running":
+            return None
+        progress = self.progress()
+        if progress <= 0:
+            return None
+        elapsed = time.time() - self.started_at
+        return round(elapsed * (1 - progress) / progress, 1)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "files_total": self.files_total,
+            "files_parsed": self.files_parsed,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "progress": round(self.progress(), 3),
+            "eta_seconds": self.eta_seconds(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# Runs embedding jobs one at a time on a background thread, so the event loop
+# keeps serving /query and /upload while an index is being built.
+class JobManager:
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        job = EmbedJob(uuid.uuid4().hex)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "completed"
+        except Exception as e:
+            print(f"Error occurred in job {job.id}: {str(e)}")
+            job.error = getattr(e, "detail", str(e))
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,242 @@
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+# Words, numbers and compound identifiers such as gene names (brca1, il-6),
+# equation labels (eq.3) and citation keys (smith2020)
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+(?:[._:/+-][0-9a-z]+)*")
+COMPOUND_SEPARATORS = re.compile(r"[._:/+-]")
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+# Terms found in more than this share of chunks are skipped when the query also has rarer terms
+COMMON_TERM_RATIO = 0.3
+MAX_TERM_FREQUENCY = np.iinfo(np.uint16).max
+
+
+# Function to split text into index terms. Compound tokens are indexed whole
+# and also as their parts, so "IL-6" matches both "il-6" and "il".
+def tokenize(text):
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in COMPOUND_SEPARATORS.split(token) if part)
+    return tokens
+
+
+def _bytes_array(values):
+    return np.array([value.encode("utf-8") for value in values] or [b""], dtype=np.bytes_)[:len(values)]
+
+
+# BM25 inverted index over chunk texts.
+#
+# On disk (and memory-mapped once loaded) the index is a set of flat arrays:
+#   terms.npy         sorted vocabulary (fixed-width bytes)
+#   term_offsets.npy  where each term's postings start in the postings arrays
+#   postings_docs.npy chunk numbers, ascending within each term (uint32)
+#   postings_tfs.npy  term frequency of each posting (uint16)
+#   doc_lengths.npy   number of terms per chunk (uint32)
+#   doc_ids.npy       chunk id of every chunk number
+#
+# add() and delete() only record pending changes; save() merges them into new
+# arrays with vectorized numpy operations, so an update tokenizes only the new
+# chunks. A loaded index that is being served is never modified.
+class LexicalIndex:
+    def __init__(self, terms, term_offsets, postings_docs, postings_tfs, doc_lengths, doc_ids,
+                 total_length, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_lengths = doc_lengths
+        self.doc_ids = doc_ids
+        self.total_length = total_length
+        self.k1 = k1
+        self.b = b
+        # Pending changes, applied by save()
+        self._deleted = np.zeros(len(doc_ids), dtype=bool)
+        self._new_ids = []
+        self._new_lengths = []
+        self._new_postings = {}
+        self._new_deleted = set()
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            terms=_bytes_array([]),
+            term_offsets=np.zeros(1, dtype=np.int64),
+            postings_docs=np.zeros(0, dtype=np.uint32),
+            postings_tfs=np.zeros(0, dtype=np.uint16),
+            doc_lengths=np.zeros(0, dtype=np.uint32),
+            doc_ids=_bytes_array([]),
+            total_length=0,
+        )
+
+    @classmethod
+    def load(cls, directory):
+        def array(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        with open(os.path.join(directory, "stats.json"), "r") as f:
+            stats = json.load(f)
+        return cls(
+            terms=array("terms"),
+            term_offsets=array("term_offsets"),
+            postings_docs=array("postings_docs"),
+            postings_tfs=array("postings_tfs"),
+            doc_lengths=array("doc_lengths"),
+            doc_ids=array("doc_ids"),
+            total_length=stats["total_length"],
+            k1=stats["k1"],
+            b=stats["b"],
+        )
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def add(self, ids, texts):
+        for chunk_id, text in zip(ids, texts):
+            doc = len(self.doc_ids) + len(self._new_ids)
+            counts = Counter(tokenize(text))
+            for term, frequency in counts.items():
+                docs, frequencies = self._new_postings.setdefault(term, ([], []))
+                docs.append(doc)
+                frequencies.append(min(frequency, MAX_TERM_FREQUENCY))
+            self._new_ids.append(chunk_id)
+            self._new_lengths.append(sum(counts.values()))
+
+    def delete(self, ids):
+        if not ids:
+            return
+        self._deleted |= np.isin(self.doc_ids, _bytes_array(list(ids)))
+        dropped = set(ids)
+        base = len(self.doc_ids)
+        self._new_deleted.update(base + i for i, chunk_id in enumerate(self._new_ids) if chunk_id in dropped)
+
+    # Function to merge the pending changes and write the index to a directory.
+    # With row_ids (the chunk id of every FAISS row), chunks are renumbered so
+    # that chunk number i is FAISS row i, letting metadata filters apply to both.
+    def save(self, directory, row_ids=None):
+        os.makedirs(directory, exist_ok=True)
+        base_count = len(self.doc_ids)
+        new_count = len(self._new_ids)
+        live = np.concatenate([
+            ~self._deleted,
+            np.array([base_count + i not in self._new_deleted for i in range(new_count)], dtype=bool),
+        ])
+        renumber = np.cumsum(live, dtype=np.int64) - 1
+
+        # Every posting as (term, chunk number, frequency), old and new together
+        new_terms = sorted(self._new_postings)
+        vocabulary = np.union1d(np.asarray(self.terms), _bytes_array(new_terms))
+        base_term_rows = np.repeat(np.arange(len(self.terms)), np.diff(self.term_offsets))
+        posting_terms = [np.searchsorted(vocabulary, np.asarray(self.terms))[base_term_rows]]
+        posting_docs = [np.asarray(self.postings_docs, dtype=np.int64)]
+        posting_tfs = [np.asarray(self.postings_tfs)]
+        new_term_rows = np.searchsorted(vocabulary, _bytes_array(new_terms))
+        for term, row in zip(new_terms, new_term_rows):
+            docs, frequencies = self._new_postings[term]
+            posting_terms.append(np.full(len(docs), row, dtype=np.int64))
+            posting_docs.append(np.asarray(docs, dtype=np.int64))
+            posting_tfs.append(np.asarray(frequencies, dtype=np.uint16))
+        terms = np.concatenate(posting_terms).astype(np.int64)
+        docs = np.concatenate(posting_docs)
+        frequencies = np.concatenate(posting_tfs)
+
+        # Drop postings of deleted chunks, renumber the rest and group by term
+        keep = live[docs]
+        terms, docs, frequencies = terms[keep], renumber[docs[keep]], frequencies[keep]
+        order = np.lexsort((docs, terms))
+        terms, docs, frequencies = terms[order], docs[order], frequencies[order]
+        counts = np.bincount(terms, minlength=len(vocabulary))
+        present = counts > 0
+
+        doc_lengths = np.concatenate([
+            np.asarray(self.doc_lengths, dtype=np.uint32),
+            np.asarray(self._new_lengths, dtype=np.uint32),
+        ])[live]
+        doc_ids = np.concatenate([np.asarray(self.doc_ids), _bytes_array(self._new_ids)])[live]
+        if row_ids is not None:
+            rows = _bytes_array(list(row_ids))
+            if len(rows) != len(doc_ids):
+                raise ValueError(f"The BM25 index holds {len(doc_ids)} chunks but the vector index has {len(rows)}.")
+            if not np.array_equal(rows, doc_ids):
+                order = np.argsort(rows, kind="stable")
+                positions = np.searchsorted(rows[order], doc_ids)
+                if not np.array_equal(rows[order][np.minimum(positions, len(rows) - 1)], doc_ids):
+                    raise ValueError("The BM25 index and the vector index hold different chunks.")
+                row_of_doc = order[positions]
+                docs = row_of_doc[docs]
+                order = np.lexsort((docs, terms))
+                terms, docs, frequencies = terms[order], docs[order], frequencies[order]
+                doc_lengths[row_of_doc] = doc_lengths.copy()
+                doc_ids = rows
+
+        np.save(os.path.join(directory, "terms.npy"), vocabulary[present])
+        np.save(os.path.join(directory, "term_offsets.npy"), np.concatenate([[0], np.cumsum(counts[present])]).astype(np.int64))
+        np.save(os.path.join(directory, "postings_docs.npy"), docs.astype(np.uint32))
+        np.save(os.path.join(directory, "postings_tfs.npy"), frequencies.astype(np.uint16))
+        np.save(os.path.join(directory, "doc_lengths.npy"), doc_lengths)
+        np.save(os.path.join(directory, "doc_ids.npy"), doc_ids)
+        with open(os.path.join(directory, "stats.json"), "w") as f:
+            json.dump({"doc_count": len(doc_ids), "total_length": int(doc_lengths.sum()), "k1": self.k1, "b": self.b}, f)
+
+    # Function to return the k best chunks for a query as (chunk id, BM25 score).
+    # `rows` restricts the search to the given chunk numbers (FAISS rows).
+    def search(self, query, k, rows=None):
+        doc_count = len(self.doc_ids)
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not doc_count or not query_terms or not len(self.terms):
+            return []
+
+        allowed = None
+        if rows is not None:
+            allowed = np.zeros(doc_count, dtype=bool)
+            allowed[rows] = True
+
+        keys = _bytes_array(query_terms)
+        term_rows = np.searchsorted(self.terms, keys)
+        found = term_rows < len(self.terms)
+        found[found] = self.terms[term_rows[found]] == keys[found]
+        term_rows = term_rows[found]
+        if not len(term_rows):
+            return []
+        starts = np.asarray(self.term_offsets[term_rows])
+        ends = np.asarray(self.term_offsets[term_rows + 1])
+        frequencies = ends - starts
+
+        # Very common terms barely change the ranking but have the longest posting lists
+        rare = frequencies <= COMMON_TERM_RATIO * doc_count
+        if rare.any():
+            starts, ends, frequencies = starts[rare], ends[rare], frequencies[rare]
+
+        average_length = self.total_length / doc_count
+        scores = np.zeros(doc_count, dtype=np.float32)
+        touched = []
+        for start, end, document_frequency in zip(starts, ends, frequencies):
+            docs = np.asarray(self.postings_docs[start:end])
+            tfs = np.asarray(self.postings_tfs[start:end], dtype=np.float32)
+            if allowed is not None:
+                keep = allowed[docs]
+                docs, tfs = docs[keep], tfs[keep]
+            lengths = np.asarray(self.doc_lengths[docs], dtype=np.float32)
+            idf = np.log(1 + (doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            # Chunk numbers are unique within one posting list, so fancy-index addition is safe
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * lengths / average_length))
+            touched.append(docs)
+
+        # A chunk appears at most once per term, so the best k * terms postings hold the best k chunks
+        candidates = np.concatenate(touched)
+        if not len(candidates):
+            return []
+        limit = min(len(candidates), k * len(touched))
+        if limit < len(candidates):
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = np.unique(candidates)
+        best = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        return [(self.doc_ids[doc].decode("utf-8"), float(scores[doc])) for doc in best]
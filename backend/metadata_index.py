@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+
+# Categorical fields: chunk metadata key -> name of the index files
+CATEGORICAL_FIELDS = {"filename": "filename", "tags": "tag"}
+
+
+def _bytes_array(values):
+    return np.array([value.encode("utf-8") for value in values] or [b""], dtype=np.bytes_)[:len(values)]
+
+
+# Chunk metadata laid out by index row, so a filter can be turned into the set
+# of matching rows without reading any chunk:
+#   page.npy                  page number of every row (-1 when unknown)
+#   uploaded_at.npy           upload time of every row in epoch seconds (NaN when unknown)
+#   <field>_values.npy        sorted distinct values of filename / tag
+#   <field>_offsets.npy       where each value's rows start in <field>_rows.npy
+#   <field>_rows.npy          ascending rows holding each value (uint32)
+#
+# select() ANDs the requested fields together as boolean row bitmaps; within
+# one field, any of the listed values matches.
+class MetadataIndex:
+    def __init__(self, pages, uploaded_at, categorical):
+        self.pages = pages
+        self.uploaded_at = uploaded_at
+        self.categorical = categorical
+
+    def __len__(self):
+        return len(self.pages)
+
+    # Function to write the index for a list of chunk metadata dicts in row order
+    @staticmethod
+    def save(directory, metadatas):
+        os.makedirs(directory, exist_ok=True)
+        pages = np.array([metadata.get("page", -1) for metadata in metadatas], dtype=np.int32)
+        uploaded_at = np.array([metadata.get("uploaded_at", np.nan) for metadata in metadatas], dtype=np.float64)
+        np.save(os.path.join(directory, "page.npy"), pages)
+        np.save(os.path.join(directory, "uploaded_at.npy"), uploaded_at)
+
+        for key, field in CATEGORICAL_FIELDS.items():
+            rows_by_value = {}
+            for row, metadata in enumerate(metadatas):
+                values = metadata.get(key)
+                if values is None:
+                    continue
+                for value in (values if isinstance(values, list) else [values]):
+                    rows_by_value.setdefault(value, []).append(row)
+            values = sorted(rows_by_value)
+            counts = [len(rows_by_value[value]) for value in values]
+            rows = [row for value in values for row in rows_by_value[value]]
+            np.save(os.path.join(directory, f"{field}_values.npy"), _bytes_array(values))
+            np.save(os.path.join(directory, f"{field}_offsets.npy"), np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]).astype(np.int64))
+            np.save(os.path.join(directory, f"{field}_rows.npy"), np.array(rows, dtype=np.uint32))
+
+    @classmethod
+    def load(cls, directory):
+        def array(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        categorical = {
+            field: (array(f"{field}_values"), array(f"{field}_offsets"), array(f"{field}_rows"))
+            for field in CATEGORICAL_FIELDS.values()
+        }
+        return cls(array("page"), array("uploaded_at"), categorical)
+
+    def _value_mask(self, field, wanted):
+        values, offsets, rows = self.categorical[field]
+        mask = np.zeros(len(self), dtype=bool)
+        keys = _bytes_array(list(wanted))
+        positions = np.searchsorted(values, keys)
+        for key, position in zip(keys, positions):
+            if position < len(values) and values[position] == key:
+                mask[rows[offsets[position]:offsets[position + 1]]] = True
+        return mask
+
+    # Function to return the ascending rows matching every given filter
+    def select(self, filenames=None, tags=None, page_from=None, page_to=None,
+               uploaded_after=None, uploaded_before=None):
+        mask = np.ones(len(self), dtype=bool)
+        if filenames:
+            mask &= self._value_mask("filename", filenames)
+        if tags:
+            mask &= self._value_mask("tag", tags)
+        if page_from is not None:
+            mask &= np.asarray(self.pages) >= page_from
+        if page_to is not None:
+            mask &= np.asarray(self.pages) <= page_to
+        if uploaded_after is not None:
+            mask &= np.asarray(self.uploaded_at) >= uploaded_after
+        if uploaded_before is not None:
+            mask &= np.asarray(self.uploaded_at) <= uploaded_before
+        return np.flatnonzero(mask)
@@ -0,0 +1,84 @@
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Prometheus metrics for the ingest and query pipelines, served by /metrics.
+# Each stage has its own histogram, so the stage limiting throughput shows up
+# directly in its rate or latency distribution.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SLOW_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+BYTE_RATE_BUCKETS = tuple(2 ** power for power in range(16, 34, 2))  # 64 KB/s to 8 GB/s
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# Ingest
+UPLOAD_BYTES = Counter("pdfquery_upload_bytes", "Bytes of PDFs stored by uploads")
+UPLOAD_BYTES_PER_SECOND = Histogram(
+    "pdfquery_upload_bytes_per_second", "Upload rate of each upload request, including receiving the body",
+    buckets=BYTE_RATE_BUCKETS,
+)
+PARSE_SECONDS_PER_PAGE = Histogram(
+    "pdfquery_parse_seconds_per_page", "PDF parse time of each file divided by its page count",
+    buckets=LATENCY_BUCKETS,
+)
+PAGES_PARSED = Counter("pdfquery_pages_parsed", "PDF pages parsed by /embed")
+SPLIT_SECONDS = Histogram("pdfquery_split_seconds", "Time to split one file into chunks", buckets=LATENCY_BUCKETS)
+EMBED_CHUNKS_PER_SECOND = Histogram(
+    "pdfquery_embed_chunks_per_second", "Embedding throughput of each batch, cache hits included",
+    buckets=THROUGHPUT_BUCKETS,
+)
+CHUNKS_EMBEDDED = Counter("pdfquery_chunks_embedded", "Chunks embedded by /embed")
+INDEX_BUILD_SECONDS = Histogram(
+    "pdfquery_index_build_seconds", "Time to build or update an index",
+    ["index", "mode"], buckets=SLOW_BUCKETS,
+)
+INDEX_SAVE_SECONDS = Histogram("pdfquery_index_save_seconds", "Time to save a vector store version", buckets=SLOW_BUCKETS)
+INDEX_LOAD_SECONDS = Histogram("pdfquery_index_load_seconds", "Time to load a vector store version", buckets=LATENCY_BUCKETS)
+
+# Query
+QUERY_STAGE_SECONDS = Histogram(
+    "pdfquery_query_stage_seconds", "Latency of each query stage (retrieval, rerank, packing, llm, total)",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "pdfquery_llm_tokens", "Estimated prompt and completion tokens per LLM call",
+    ["kind"], buckets=TOKEN_BUCKETS,
+)
+ERRORS = Counter("pdfquery_errors", "Requests that failed with an unexpected error", ["endpoint"])
+
+
+# Reads the cache counters the caches already keep at scrape time, so the hot
+# paths are not instrumented twice
+class CacheCollector:
+    def __init__(self, embedding_cache, page_text_cache, collection_manager):
+        self.embedding_cache = embedding_cache
+        self.page_text_cache = page_text_cache
+        self.collection_manager = collection_manager
+
+    def collect(self):
+        lookups = CounterMetricFamily("pdfquery_cache_lookups", "Cache lookups by cache and result", labels=["cache", "collection", "result"])
+        ratios = GaugeMetricFamily("pdfquery_cache_hit_ratio", "Share of cache lookups that were hits", labels=["cache", "collection"])
+
+        for name, cache in (("embedding", self.embedding_cache), ("page_text", self.page_text_cache)):
+            lookups.add_metric([name, "", "hit"], cache.hits)
+            lookups.add_metric([name, "", "miss"], cache.misses)
+            total = cache.hits + cache.misses
+            ratios.add_metric([name, ""], cache.hits / total if total else 0.0)
+
+        for collection in self.collection_manager.all():
+            cache = collection.answer_cache
+            lookups.add_metric(["answer", collection.name, "exact_hit"], cache.exact_hits)
+            lookups.add_metric(["answer", collection.name, "semantic_hit"], cache.semantic_hits)
+            lookups.add_metric(["answer", collection.name, "miss"], cache.misses)
+            total = cache.exact_hits + cache.semantic_hits + cache.misses
+            ratios.add_metric(["answer", collection.name], (cache.exact_hits + cache.semantic_hits) / total if total else 0.0)
+
+        loaded = GaugeMetricFamily("pdfquery_collections_loaded", "Collections with their index loaded")
+        loaded.add_metric([], len(self.collection_manager.loaded()))
+        evictions = CounterMetricFamily("pdfquery_collection_evictions", "Collections unloaded to free memory")
+        evictions.add_metric([], self.collection_manager.evictions)
+        yield from (lookups, ratios, loaded, evictions)
+
+
+def register_cache_metrics(embedding_cache, page_text_cache, collection_manager):
+    REGISTRY.register(CacheCollector(embedding_cache, page_text_cache, collection_manager))
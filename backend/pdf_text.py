@@ -0,0 +1,175 @@
+import importlib.util
+import sqlite3
+import threading
+import time
+
+# Text extraction backends, fastest first. "auto" picks the first one installed:
+#   pypdfium2  PDFium (C++) bindings, optional
+#   pypdf      pure Python, installed with the backend requirements
+#   pdfminer   pdfminer.six layout analysis, slowest but most tolerant of odd encodings
+BACKENDS = ("pypdfium2", "pypdf", "pdfminer")
+BACKEND_MODULES = {"pypdfium2": "pypdfium2", "pypdf": "pypdf", "pdfminer": "pdfminer"}
+# SQLite limits the number of bound parameters per statement
+SQLITE_BATCH_SIZE = 500
+
+
+def available_backends():
+    return [name for name in BACKENDS if importlib.util.find_spec(BACKEND_MODULES[name]) is not None]
+
+
+# Function to turn a PDF_TEXT_BACKEND setting into an installed backend name
+def resolve_backend(name="auto"):
+    available = available_backends()
+    if name == "auto":
+        if not available:
+            raise ValueError(f"No PDF text backend is installed; install one of {', '.join(BACKENDS)}.")
+        return available[0]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF text backend {name!r}; expected auto or one of {', '.join(BACKENDS)}.")
+    if name not in available:
+        raise ValueError(f"PDF text backend {name!r} is not installed.")
+    return name
+
+
+def _pypdfium2_pages(source):
+    import pypdfium2
+
+    document = pypdfium2.PdfDocument(source)
+    try:
+        texts = []
+        for page in document:
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range().replace("\r\n", "\n"))
+            textpage.close()
+            page.close()
+        return texts
+    finally:
+        document.close()
+
+
+def _pypdf_pages(source):
+    from pypdf import PdfReader
+
+    return [page.extract_text() or "" for page in PdfReader(source).pages]
+
+
+def _pdfminer_pages(source):
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    return [
+        "".join([element.get_text() for element in layout if isinstance(element, LTTextContainer)])
+        for layout in extract_pages(source)
+    ]
+
+
+EXTRACTORS = {"pypdfium2": _pypdfium2_pages, "pypdf": _pypdf_pages, "pdfminer": _pdfminer_pages}
+
+
+# Function to extract the text of every page of a PDF (a path or binary file
+# object). Runs inside worker processes, so it has to stay a module-level function.
+def extract_pages(source, backend):
+    return EXTRACTORS[backend](source)
+
+
+# Function to extract the text of a whole PDF, one line break between pages
+def extract_text(source, backend="auto"):
+    return "\n".join(extract_pages(source, resolve_backend(backend)))
+
+
+# Persistent cache of extracted page text stored in a local SQLite file, so
+# re-embedding a file (a full rebuild, a new chunking or embedding model) never
+# parses it again. Pages are keyed by (file hash, page); a file is only served
+# from the cache when all its pages were stored by the same backend. Whole files
+# are evicted in least-recently-used order once more than max_pages pages are stored.
+class PageTextCache:
+    def __init__(self, path, max_pages):
+        self.path = path
+        self.max_pages = max_pages
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "file_hash TEXT PRIMARY KEY, backend TEXT NOT NULL, pages INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "file_hash TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, PRIMARY KEY (file_hash, page))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used)")
+        self._conn.commit()
+
+    # Function to return which of the given files are cached for this backend,
+    # counting hits and misses. Found files are marked as recently used, so
+    # files put while the job runs evict other entries before these.
+    def cached_files(self, file_hashes, backend):
+        found = set()
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(file_hashes), SQLITE_BATCH_SIZE):
+                batch = file_hashes[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT file_hash FROM files WHERE backend = ? AND file_hash IN ({placeholders})", [backend, *batch]
+                ).fetchall()
+                found.update(file_hash for (file_hash,) in rows)
+                self._conn.executemany("UPDATE files SET last_used = ? WHERE file_hash = ?", [(now, file_hash) for (file_hash,) in rows])
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(file_hashes)) - len(found)
+        return found
+
+    # Function to read the page texts of a cached file in page order and mark
+    # it as recently used. Returns None if the file is no longer cached, e.g.
+    # evicted by a put since cached_files was called.
+    def get(self, file_hash):
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM files WHERE file_hash = ?", (file_hash,)).fetchone() is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT text FROM pages WHERE file_hash = ? ORDER BY page", (file_hash,)
+            ).fetchall()
+            self._conn.execute("UPDATE files SET last_used = ? WHERE file_hash = ?", (time.time(), file_hash))
+            self._conn.commit()
+        return [text for (text,) in rows]
+
+    # Function to store the page texts of a file and evict the least recently used files over the cap
+    def put(self, file_hash, texts, backend):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE file_hash = ?", (file_hash,))
+            self._conn.executemany(
+                "INSERT INTO pages (file_hash, page, text) VALUES (?, ?, ?)",
+                [(file_hash, page, text) for page, text in enumerate(texts)],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_hash, backend, pages, last_used) VALUES (?, ?, ?, ?)",
+                (file_hash, backend, len(texts), time.time()),
+            )
+            (total,) = self._conn.execute("SELECT COALESCE(SUM(pages), 0) FROM files").fetchone()
+            if total > self.max_pages:
+                evicted = []
+                for evict_hash, pages in self._conn.execute(
+                    "SELECT file_hash, pages FROM files WHERE file_hash != ? ORDER BY last_used", (file_hash,)
+                ).fetchall():
+                    if total <= self.max_pages:
+                        break
+                    evicted.append((evict_hash,))
+                    total -= pages
+                self._conn.executemany("DELETE FROM pages WHERE file_hash = ?", evicted)
+                self._conn.executemany("DELETE FROM files WHERE file_hash = ?", evicted)
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            files, pages = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM files").fetchone()
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "files": files,
+                "pages": pages,
+                "max_pages": self.max_pages,
+            }
@@ -0,0 +1,79 @@
+import numpy as np
+
+STORAGE_TYPES = ("float32", "float16", "sq8", "pq")
+
+
+# A compressed FAISS index paired with the original float32 vectors.
+#
+# The compressed index (float16, int8 scalar quantization or product
+# quantization) is what stays resident in memory and is searched first. The
+# float32 vectors are kept memory-mapped from disk and only the rows of the top
+# rerank_factor * k candidates are read to re-order them by exact L2 distance.
+# Every other attribute is forwarded to the wrapped index, so the LangChain
+# FAISS wrapper can use it like a plain FAISS index.
+class RerankedIndex:
+    def __init__(self, index, vectors, rerank_factor):
+        self.index = index
+        self.vectors = vectors
+        self.rerank_factor = rerank_factor
+        self._buffer = None
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def search(self, x, k, params=None):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        fetch = min(max(k, k * self.rerank_factor), self.index.ntotal)
+        if fetch == 0:
+            return np.full((len(x), k), np.inf, dtype=np.float32), np.full((len(x), k), -1, dtype=np.int64)
+        if params is None:
+            _, candidates = self.index.search(x, fetch)
+        else:
+            _, candidates = self.index.search(x, fetch, params=params)
+
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        rows = np.full((len(x), k), -1, dtype=np.int64)
+        for q, query_candidates in enumerate(candidates):
+            query_candidates = query_candidates[query_candidates >= 0]
+            if not len(query_candidates):
+                continue
+            # Read candidate rows in file order so the memory map is accessed sequentially
+            query_candidates = np.sort(query_candidates)
+            exact = ((np.asarray(self.vectors[query_candidates]) - x[q]) ** 2).sum(axis=1)
+            best = np.argsort(exact, kind="stable")[:k]
+            distances[q, :len(best)] = exact[best]
+            rows[q, :len(best)] = query_candidates[best]
+        return distances, rows
+
+    def add(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        self.index.add(x)
+        # Grow the float32 copy geometrically, so adding many small batches stays linear
+        count = len(self.vectors)
+        if self._buffer is None or count + len(x) > len(self._buffer):
+            buffer = np.empty((max(count + len(x), 2 * count), x.shape[1]), dtype=np.float32)
+            buffer[:count] = self.vectors
+            self._buffer = buffer
+        self._buffer[count:count + len(x)] = x
+        self.vectors = self._buffer[:count + len(x)]
+
+    def remove_ids(self, ids):
+        removed = self.index.remove_ids(ids)
+        self.vectors = np.delete(np.asarray(self.vectors), np.asarray(ids, dtype=np.int64), axis=0)
+        self._buffer = None
+        return removed
+
+    # Exact vectors come from the float32 copy, not the lossy codes
+    def reconstruct(self, row):
+        return np.asarray(self.vectors[row])
+
+    def reconstruct_n(self, start, count):
+        return np.asarray(self.vectors[start:start + count])
+
+    def reconstruct_batch(self, rows):
+        return np.asarray(self.vectors[np.asarray(rows, dtype=np.int64)])
+
+
+# Function to unwrap a RerankedIndex to the FAISS index inside it
+def raw_index(index):
+    return index.index if isinstance(index, RerankedIndex) else index
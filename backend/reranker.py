@@ -0,0 +1,105 @@
+import threading
+import time
+
+# Weight of the newest measurement in the running cost-per-pair estimate
+COST_SMOOTHING = 0.2
+
+# While re-ranking is being skipped for cost, every this many skips still
+# scores the top_n candidates to re-measure the cost
+PROBE_EVERY_SKIPS = 20
+
+
+# Re-orders retrieved chunks with a small cross-encoder that reads the question
+# and each chunk together. All candidates are scored in one batched forward pass
+# on the CPU and only the top_n best are kept.
+#
+# The cost of scoring one (question, chunk) pair is tracked as a running
+# average. When scoring every candidate would take longer than budget_ms, only
+# as many candidates as fit the budget are scored; if fewer than top_n fit,
+# re-ranking is skipped and the retriever's own top_n are used. The estimate is
+# only updated by scoring, so while skipping, every PROBE_EVERY_SKIPS-th request
+# scores just the top_n candidates and takes that as the new estimate, so one
+# slow measurement (e.g. during a load spike) cannot turn re-ranking off for good.
+class CrossEncoderReranker:
+    def __init__(self, model_name, top_n=4, budget_ms=200.0, max_length=256):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.budget_ms = budget_ms
+        self.max_length = max_length
+        self.reranked = 0
+        self.truncated = 0
+        self.skipped = 0
+        self.probes = 0
+        self._ms_per_pair = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # Imported here so processes that never re-rank (e.g. PDF parse workers) skip torch
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return self._model
+
+    # Function to load the weights and measure the cost of a batch before the
+    # first request. The pairs are padded to max_length like full-size chunks,
+    # and the first (slower) pass is not counted.
+    def warm(self):
+        text = " ".join(["warm up"] * self.max_length)
+        self._score("warm up", [text] * self.top_n)
+        self._ms_per_pair = None
+        self._score("warm up", [text] * self.top_n)
+
+    def _score(self, query, texts):
+        start = time.perf_counter()
+        scores = self.model.predict(
+            [(query, text) for text in texts],
+            batch_size=len(texts),
+            show_progress_bar=False,
+        )
+        ms_per_pair = (time.perf_counter() - start) * 1000 / len(texts)
+        if self._ms_per_pair is None:
+            self._ms_per_pair = ms_per_pair
+        else:
+            self._ms_per_pair += COST_SMOOTHING * (ms_per_pair - self._ms_per_pair)
+        return scores
+
+    # Function to return the top_n documents for a question, best first
+    def rerank(self, query, documents):
+        if len(documents) <= self.top_n:
+            return documents
+        candidates = documents
+        if self.budget_ms > 0 and self._ms_per_pair:
+            fit = int(self.budget_ms / self._ms_per_pair)
+            if fit < self.top_n:
+                self.skipped += 1
+                if self.skipped % PROBE_EVERY_SKIPS:
+                    return documents[:self.top_n]
+                # The probe's measurement replaces the stale estimate outright
+                self.probes += 1
+                self._ms_per_pair = None
+                candidates = candidates[:self.top_n]
+            elif fit < len(candidates):
+                self.truncated += 1
+                candidates = candidates[:fit]
+
+        scores = self._score(query, [doc.page_content for doc in candidates])
+        self.reranked += 1
+        best = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:self.top_n]
+        return [candidates[i] for i in best]
+
+    def stats(self):
+        return {
+            "model_name": self.model_name,
+            "top_n": self.top_n,
+            "budget_ms": self.budget_ms,
+            "reranked": self.reranked,
+            "truncated": self.truncated,
+            "skipped": self.skipped,
+            "probes": self.probes,
+            "ms_per_pair": round(self._ms_per_pair, 3) if self._ms_per_pair is not None else None,
+        }
@@ -0,0 +1,127 @@
+from typing import Any, List, Optional
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+from index_factory import search_parameters, supports_selector
+
+# Constant of reciprocal rank fusion; larger values flatten the gap between top and lower ranks
+RRF_K = 60
+# Filters matching at most this many chunks are searched exactly over the stored vectors
+EXACT_SEARCH_ROWS = 4096
+
+
+# Function to fuse ranked lists of chunk ids with reciprocal rank fusion.
+# Returns chunk ids ordered by their summed 1 / (rrf_k + rank) scores.
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# Function to score rows exactly from their stored vectors, EXACT_SEARCH_ROWS
+# at a time so large selections are not reconstructed all at once. Returns
+# None when the index cannot reconstruct vectors (IVF without a direct map).
+def exact_search_rows(index, vector, k, rows):
+    best_rows = np.empty(0, dtype=np.int64)
+    best_distances = np.empty(0, dtype=np.float32)
+    for start in range(0, len(rows), EXACT_SEARCH_ROWS):
+        batch = rows[start:start + EXACT_SEARCH_ROWS]
+        try:
+            vectors = index.reconstruct_batch(batch)
+        except RuntimeError:
+            return None
+        distances = ((np.asarray(vectors, dtype=np.float32) - vector[0]) ** 2).sum(axis=1)
+        best_rows = np.concatenate([best_rows, batch])
+        best_distances = np.concatenate([best_distances, distances])
+        order = np.argsort(best_distances, kind="stable")[:k]
+        best_rows, best_distances = best_rows[order], best_distances[order]
+    return best_rows
+
+
+# Function to find the k nearest of the given FAISS rows to a query vector.
+# Small selections are scored exactly from their stored vectors; larger ones
+# hand FAISS a bitmap selector, so the index skips every other row instead of
+# the results being over-fetched and filtered afterwards. Indexes that cannot
+# take a selector are always scored exactly.
+def search_index_rows(index, vector, k, rows):
+    if len(rows) <= EXACT_SEARCH_ROWS or not supports_selector(index):
+        found = exact_search_rows(index, vector, k, rows)
+        if found is not None:
+            return found
+    mask = np.zeros(index.ntotal, dtype=bool)
+    mask[rows] = True
+    bitmap = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(index.ntotal, faiss.swig_ptr(bitmap))
+    _, found = index.search(vector, k, params=search_parameters(index, selector))
+    return found[0][found[0] >= 0]
+
+
+# Function to run a dense search of a vector store over the given rows only
+def search_rows(vector_store, query, k, rows):
+    if not len(rows):
+        return []
+    vector = np.asarray([vector_store.embedding_function.embed_query(query)], dtype=np.float32)
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(vector)
+    found = search_index_rows(vector_store.index, vector, k, rows)
+    return [vector_store.docstore.search(vector_store.index_to_docstore_id[int(row)]) for row in found]
+
+
+# Retriever combining FAISS similarity search with the BM25 index. Each side
+# returns its fetch_k best chunks and the fused top k are passed to the LLM,
+# so exact matches on gene names, equation labels and citation keys are found
+# even when their embeddings are not close to the question's. Without a BM25
+# index it returns the dense top k.
+#
+# invoke(query, filters={...}) restricts both searches to the rows the metadata
+# index selects (see MetadataIndex.select for the filter names).
+class HybridRetriever(BaseRetriever):
+    vector_store: Any
+    lexical_index: Any = None
+    metadata_index: Any = None
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = RRF_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                filters: Optional[dict] = None) -> List[Document]:
+        rows = None
+        if filters:
+            if self.metadata_index is None:
+                raise ValueError("This index was built without metadata filters. Please call /embed?full=true to rebuild it.")
+            rows = self.metadata_index.select(**filters)
+
+        fetch_k = self.fetch_k if self.lexical_index is not None else self.k
+        if rows is None:
+            dense = self.vector_store.similarity_search(query, k=fetch_k)
+        else:
+            dense = search_rows(self.vector_store, query, fetch_k, rows)
+        if self.lexical_index is None:
+            return dense[:self.k]
+        lexical = self.lexical_index.search(query, self.fetch_k, rows)
+
+        documents = {doc.id: doc for doc in dense}
+        ranked = reciprocal_rank_fusion(
+            [[doc.id for doc in dense], [chunk_id for chunk_id, _ in lexical]],
+            self.rrf_k,
+        )[:self.k]
+        results = []
+        for chunk_id in ranked:
+            doc = documents.get(chunk_id) or self.vector_store.docstore.search(chunk_id)
+            if isinstance(doc, Document):
+                results.append(doc)
+        return results
+
+    # The inherited async method does not take `filters`, and ainvoke passes it on
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       filters: Optional[dict] = None) -> List[Document]:
+        return await run_in_executor(
+            None, self._get_relevant_documents, query, run_manager=run_manager.get_sync(), filters=filters
+        )
@@ -0,0 +1,74 @@
+# Shared fixtures: the FastAPI app running in a temporary working directory
+# with a deterministic fake embedding model and a fake chat model, so the
+# tests are offline.
+import importlib
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "benchmarks"))
+
+from bench_end_to_end import write_pdf
+
+ANSWER = "A fake answer."
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("app")
+    previous = os.getcwd()
+    os.environ.setdefault("GROQ_API_KEY", "test")
+    os.environ["INGEST_WORKERS"] = "1"
+    os.chdir(workdir)
+    try:
+        server = importlib.import_module("app")
+        server.embedding_model._model = DeterministicFakeEmbedding(size=32)
+        server.llm = FakeListChatModel(responses=[ANSWER])
+        yield server
+    finally:
+        server.job_manager.shutdown()
+        server.shutdown_parse_pool()
+        os.chdir(previous)
+
+
+@pytest.fixture(scope="session")
+def app_client(server):
+    with TestClient(server.app) as client:
+        yield client
+
+
+# Function to write one single-page PDF per (name, lines) and post them to /upload/batch
+def upload(client, directory, files, collection="default", tags=None):
+    handles = []
+    for number, (name, lines) in enumerate(files):
+        path = os.path.join(directory, f"{number}.pdf")
+        write_pdf(path, [lines])
+        handles.append(("files", (name, open(path, "rb"), "application/pdf")))
+    try:
+        params = {"collection": collection, **({"tags": tags} if tags else {})}
+        response = client.post("/upload/batch", params=params, files=handles)
+    finally:
+        for _, (_, f, _) in handles:
+            f.close()
+    assert response.status_code == 200, response.text
+    return response.json()["files"]
+
+
+# Function to run /embed on a collection and wait for the job to complete
+def embed(client, collection="default"):
+    response = client.post("/embed", params={"collection": collection})
+    assert response.status_code == 202, response.text
+    while True:
+        job = client.get(f"/jobs/{response.json()['job_id']}").json()
+        if job["status"] in ("completed", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "completed", job
+    return job
@@ -0,0 +1,44 @@
+# Tests of incremental /embed runs when files are renamed or re-tagged without
+# their content changing.
+import os
+
+from conftest import embed, upload
+
+LINES = ["The gamma valve closes at forty bar."]
+
+
+def query(client, collection, filters):
+    response = client.post("/query", params={"collection": collection},
+                           json={"question": "When does the gamma valve close?", "filters": filters})
+    assert response.status_code == 200, response.text
+    return response.json()["context"]
+
+
+def test_renamed_content_is_relabelled(server, app_client, tmp_path):
+    upload(app_client, tmp_path, [("b.pdf", LINES)], collection="rename")
+    embed(app_client, "rename")
+
+    # Same bytes, new name and tags: the vectors are kept, the labels follow the file
+    os.remove(os.path.join(server.get_collection("rename", load=False).upload_dir, "b.pdf"))
+    upload(app_client, tmp_path, [("c.pdf", LINES)], collection="rename", tags="valves")
+    job = embed(app_client, "rename")
+    assert job["result"]["files_embedded"] == 0
+    assert job["result"]["files_relabelled"] == 1
+
+    context = query(app_client, "rename", {"filenames": ["c.pdf"], "tags": ["valves"]})
+    assert context
+    assert {doc["metadata"]["filename"] for doc in context} == {"c.pdf"}
+    assert all(doc["metadata"]["source"].endswith("c.pdf") for doc in context)
+    assert query(app_client, "rename", {"filenames": ["b.pdf"]}) == []
+
+
+def test_tags_of_a_repeated_upload_are_added(app_client, tmp_path):
+    upload(app_client, tmp_path, [("a.pdf", LINES)], collection="retag")
+    embed(app_client, "retag")
+
+    result, = upload(app_client, tmp_path, [("again.pdf", LINES)], collection="retag", tags="valves")
+    assert result["duplicate"] and result["filename"] == "a.pdf"
+    embed(app_client, "retag")
+
+    context = query(app_client, "retag", {"tags": ["valves"]})
+    assert {doc["metadata"]["filename"] for doc in context} == {"a.pdf"}
@@ -0,0 +1,45 @@
+# End-to-end tests of /query and /query/stream after uploading and embedding PDFs.
+import json
+
+import pytest
+
+from conftest import ANSWER, embed, upload
+
+
+@pytest.fixture(scope="module")
+def client(app_client, tmp_path_factory):
+    upload(app_client, tmp_path_factory.mktemp("pdfs"), [
+        ("alpha.pdf", ["The alpha reactor runs at four hundred kelvin."]),
+        ("beta.pdf", ["The beta pump moves nine litres per second."]),
+    ], collection="query", tags="lab")
+    embed(app_client, "query")
+    return app_client
+
+
+def query(client, path, question, filters=None):
+    body = {"question": question, **({"filters": filters} if filters else {})}
+    return client.post(path, params={"collection": "query"}, json=body)
+
+
+def test_query(client):
+    response = query(client, "/query", "How hot does the alpha reactor run?")
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["answer"] == ANSWER
+    assert body["context"]
+
+
+def test_query_with_filters(client):
+    response = query(client, "/query", "How fast is the pump?", {"filenames": ["beta.pdf"], "tags": ["lab"]})
+    assert response.status_code == 200, response.text
+    context = response.json()["context"]
+    assert context
+    assert {doc["metadata"]["filename"] for doc in context} == {"beta.pdf"}
+
+
+def test_query_stream(client):
+    response = query(client, "/query/stream", "What does the alpha reactor do?", {"filenames": ["alpha.pdf"]})
+    assert response.status_code == 200, response.text
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[0]["type"] == "context"
+    assert events[-1]["type"] == "done"
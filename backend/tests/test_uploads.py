@@ -0,0 +1,68 @@
+# Tests of the upload size limit and of how uploaded files are named on disk.
+import os
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from conftest import upload
+from uploads import RequestSizeLimit
+
+LIMIT = 100 * 1024
+BOUNDARY = "test-boundary"
+
+
+def limited_app():
+    app = FastAPI()
+    app.add_middleware(RequestSizeLimit, limits={"/upload": LIMIT})
+
+    @app.post("/upload")
+    async def upload(pdf: UploadFile = File(...)):
+        return {"size": len(await pdf.read())}
+
+    return app
+
+
+def multipart_body(size):
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="pdf"; filename="big.pdf"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode() + b"x" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def post(client, body, chunked):
+    headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+    if chunked:
+        content = (body[start:start + 16384] for start in range(0, len(body), 16384))
+    else:
+        content = body
+    return client.post("/upload", content=content, headers=headers)
+
+
+def test_upload_within_limit():
+    client = TestClient(limited_app())
+    for chunked in (False, True):
+        response = post(client, multipart_body(LIMIT), chunked)
+        assert response.status_code == 200, response.text
+        assert response.json() == {"size": LIMIT}
+
+
+def test_oversized_upload_is_rejected_with_413():
+    client = TestClient(limited_app())
+    for chunked in (False, True):
+        response = post(client, multipart_body(1024 * 1024), chunked)
+        assert response.status_code == 413, (chunked, response.text)
+        assert response.json()["detail"] == f"Request exceeds the maximum upload size of {LIMIT} bytes."
+
+
+def test_same_name_in_one_batch_is_kept_apart(server, app_client, tmp_path):
+    results = upload(app_client, tmp_path, [
+        ("paper.pdf", ["First paper."]),
+        ("other/paper.pdf", ["Second paper."]),
+    ], collection="names")
+    first, second = results
+    assert first["filename"] == "paper.pdf"
+    assert second["filename"] == f"paper-{second['sha256'][:8]}.pdf"
+    assert not first["duplicate"] and not second["duplicate"]
+    directory = server.get_collection("names", load=False).upload_index.directory
+    assert sorted(os.listdir(directory)) == sorted([first["filename"], second["filename"]])
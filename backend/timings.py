@@ -0,0 +1,43 @@
+import threading
+from collections import deque
+
+
+# Latency of each query stage (retrieval, rerank, llm, total). Keeps a running
+# count and total per stage, plus the most recent `window` samples for percentiles.
+class StageTimings:
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, milliseconds):
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+                self._totals[stage] = 0.0
+            self._samples[stage].append(milliseconds)
+            self._counts[stage] += 1
+            self._totals[stage] += milliseconds
+
+    def stats(self):
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            counts = dict(self._counts)
+            totals = dict(self._totals)
+
+        def percentile(values, q):
+            return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+        return {
+            stage: {
+                "count": counts[stage],
+                "mean_ms": round(totals[stage] / counts[stage], 3),
+                "p50_ms": percentile(values, 0.5),
+                "p95_ms": percentile(values, 0.95),
+                "p99_ms": percentile(values, 0.99),
+            }
+            for stage, values in samples.items()
+        }
@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+
+# Uploads are copied to disk in 1 MB chunks
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+# Room for multipart boundaries, headers and form fields around the file data
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+# Raised while streaming when an upload grows past the configured maximum
+class UploadTooLarge(Exception):
+    pass
+
+
+# ASGI middleware capping the request body of the upload endpoints. Starlette
+# receives and spools the whole multipart body before the handler runs, so a
+# limit checked in the handler only applies after an oversized upload has been
+# received. This rejects a too large Content-Length with 413 before reading
+# the body, and stops bodies without one (chunked) as soon as they pass the limit.
+# FastAPI turns the error raised mid-body into its own 400 ("error parsing the
+# body"), so that response is replaced with the 413 on its way out.
+# `limits` maps request paths to their maximum upload size in bytes (0
+# disables); MULTIPART_OVERHEAD_BYTES is allowed on top for the form encoding.
+class RequestSizeLimit:
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request exceeds the maximum upload size of {limit} bytes."
+        max_body = limit + MULTIPART_OVERHEAD_BYTES
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_body:
+            await _send_too_large(send, detail)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    exceeded = True
+                    raise UploadTooLarge(detail)
+            return message
+
+        async def limited_send(message):
+            nonlocal response_started
+            if exceeded:
+                # Whatever the app answers to the aborted body becomes the 413
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await _send_too_large(send, detail)
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except UploadTooLarge:
+            if response_started:
+                raise
+            await _send_too_large(send, detail)
+
+
+async def _send_too_large(send, detail):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# Writes a stream to a temporary file in the target directory, hashing and
+# counting bytes as they arrive. commit() moves it into place; discard() drops it.
+class HashingWriter:
+    def __init__(self, directory, max_bytes):
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise UploadTooLarge(f"File exceeds the maximum upload size of {self.max_bytes} bytes.")
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+    def commit(self, path):
+        self.file.close()
+        os.replace(self.tmp_path, path)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+# Content hashes of the files in the upload directory, so a file that is already
+# stored (under any name) is not written again. Entries use the same
+# {"hash", "size", "mtime"} shape as the manifest, which lets /embed reuse the
+# hash computed during upload instead of reading the file again. Tags given at
+# upload are kept per file and copied into the metadata of its chunks.
+class UploadIndex:
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.names_by_hash = {}
+        self.tags = {}
+        self._lock = threading.Lock()
+
+    def find(self, file_hash):
+        with self._lock:
+            name = self.names_by_hash.get(file_hash)
+        if name is not None and os.path.exists(os.path.join(self.directory, name)):
+            return name
+        return None
+
+    def add(self, name, file_hash, tags=()):
+        stat = os.stat(os.path.join(self.directory, name))
+        with self._lock:
+            previous = self.files.get(name)
+            if previous and self.names_by_hash.get(previous["hash"]) == name:
+                del self.names_by_hash[previous["hash"]]
+            self.files[name] = {"hash": file_hash, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+            self.names_by_hash[file_hash] = name
+            self.tags[name] = sorted(set(tags))
+
+    def add_tags(self, name, tags):
+        with self._lock:
+            self.tags[name] = sorted(set(self.tags.get(name, [])) | set(tags))
+
+    def tags_for(self, name):
+        with self._lock:
+            return list(self.tags.get(name, []))
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.files)
+
+    def clear(self):
+        with self._lock:
+            self.files.clear()
+            self.names_by_hash.clear()
+            self.tags.clear()
+
+
+def _upload_name(filename):
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if not name:
+        raise ValueError("Uploaded file has no name.")
+    return name
+
+
+# Function to turn an archive member path into a safe relative path. Folders
+# are kept, so a/paper.pdf and b/paper.pdf are stored as two files; absolute
+# paths, drive letters and "." / ".." parts are dropped so nothing is written
+# outside the upload directory.
+def _member_name(filename):
+    parts = [part for part in (filename or "").replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    if parts and parts[0].endswith(":"):
+        parts = parts[1:]
+    if not parts:
+        raise ValueError("Archive member has no name.")
+    return os.path.join(*parts)
+
+
+# Function to add the start of the content hash to a file name, e.g. paper-1a2b3c4d.pdf
+def _unique_name(name, file_hash):
+    root, extension = os.path.splitext(name)
+    return f"{root}-{file_hash[:8]}{extension}"
+
+
+# Function to move a fully written upload into place, unless a file with the
+# same content is already stored, in which case nothing new is kept on disk.
+# `claimed` collects the names stored by the current request: a later file of
+# that request with the same name but other content gets a hash suffix instead
+# of overwriting the earlier one. Across requests, the same name replaces the file.
+def _finish(writer, name, upload_index, tags=(), claimed=None):
+    file_hash = writer.hexdigest()
+    existing = upload_index.find(file_hash)
+    if existing is not None:
+        writer.discard()
+        # Tags given with the repeated content still apply to the stored file
+        upload_index.add_tags(existing, tags)
+        return {"filename": existing, "sha256": file_hash, "size": writer.size, "duplicate": True}
+
+    if claimed is not None:
+        if name in claimed:
+            name = _unique_name(name, file_hash)
+        claimed.add(name)
+    path = os.path.join(upload_index.directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    writer.commit(path)
+    upload_index.add(name, file_hash, tags)
+    return {"filename": name, "sha256": file_hash, "size": writer.size, "duplicate": False}
+
+
+# Function to stream an UploadFile into the upload directory. Returns the stored
+# file name, content hash and size, and whether the content was a duplicate.
+async def save_upload(upload, upload_index, max_bytes, tags=(), claimed=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    name = _upload_name(upload.filename)
+    writer = HashingWriter(upload_index.directory, max_bytes)
+    try:
+        while chunk := await upload.read(chunk_size):
+            writer.write(chunk)
+    except BaseException:
+        writer.discard()
+        raise
+    return _finish(writer, name, upload_index, tags, claimed)
+
+
+# Same as save_upload for a synchronous file object. `name` is the relative
+# path to store it under, e.g. an archive member's sanitized path.
+def save_stream(fileobj, name, upload_index, max_bytes, tags=(), claimed=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    writer = HashingWriter(upload_index.directory, max_bytes)
+    try:
+        while chunk := fileobj.read(chunk_size):
+            writer.write(chunk)
+    except BaseException:
+        writer.discard()
+        raise
+    return _finish(writer, name, upload_index, tags, claimed)
+
+
+def is_archive(filename):
+    return (filename or "").lower().endswith(ARCHIVE_SUFFIXES)
+
+
+# Function to store every PDF inside a zip or tar archive under its path in the
+# archive. Members are streamed one at a time, and max_bytes applies to each extracted PDF.
+def extract_archive(path, upload_index, max_bytes, tags=(), claimed=None):
+    results = []
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.lower().endswith(".pdf"):
+                    continue
+                with archive.open(member) as fileobj:
+                    results.append(save_stream(fileobj, _member_name(member.filename), upload_index, max_bytes, tags, claimed))
+        return results
+
+    with tarfile.open(path, "r:*") as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.lower().endswith(".pdf"):
+                continue
+            fileobj = archive.extractfile(member)
+            with fileobj:
+                results.append(save_stream(fileobj, _member_name(member.name), upload_index, max_bytes, tags, claimed))
+    return results
+
+
+# Function to spool an uploaded archive to disk and store the PDFs inside it
+async def save_archive(upload, upload_index, max_archive_bytes, max_bytes, tags=(), claimed=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    writer = HashingWriter(upload_index.directory, max_archive_bytes)
+    try:
+        while chunk := await upload.read(chunk_size):
+            writer.write(chunk)
+        writer.file.close()
+        # Extraction is blocking file work, so keep it off the event loop
+        return await asyncio.to_thread(extract_archive, writer.tmp_path, upload_index, max_bytes, tags, claimed)
+    finally:
+        writer.discard()
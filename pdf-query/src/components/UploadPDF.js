@@ -65,8 +65,26 @@ const UploadPDF = () => {
         return;
       }
 
-      const data = await response.json();
-      setMessage(data.message || "Embedding process completed successfully!");
+      // Embedding runs as a background job; poll it until it finishes
+      const { job_id } = await response.json();
+      let job;
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobResponse = await fetch(`http://localhost:8000/jobs/${job_id}`);
+        job = await jobResponse.json();
+        if (job.status === "running") {
+          setMessage(
+            `Embedding... ${Math.round(job.progress * 100)}% (${job.files_parsed}/${job.files_total} files)`
+          );
+        }
+      } while (job.status === "queued" || job.status === "running");
+
+      if (job.status === "failed") {
+        setMessage(`Error embedding documents: ${job.error || "Unknown error"}`);
+        return;
+      }
+
+      setMessage(job.result.message || "Embedding process completed successfully!");
       navigate("/query");
     } catch (error) {
       console.error("Error embedding documents:", error);
@@ -8,6 +8,11 @@ export const apiService = {
     return response.json();
   },
 
+  async getJob(jobId) {
+    const response = await fetch(`${API_URL}/jobs/${jobId}`);
+    return response.json();
+  },
+
   async queryDocuments(question) {
     const response = await fetch(`${API_URL}/query`, {
       method: 'POST',